@@ -0,0 +1,97 @@
+import asyncio
+import bisect
+
+
+class BatchCoalescer:
+    """Collects texts submitted by concurrent coroutines and scores them in padded batches
+
+    Only one batch runs at a time: forward passes already use every intra-op thread, so
+    overlapping them just oversubscribes the CPU. Texts submitted meanwhile keep queueing
+    and go out together once the running batch is done.
+    """
+
+    LENGTH_BUCKETS = (32, 64, 128, 256)
+
+    def __init__(self, score_fn, tokenize_fn, max_batch_size=32, max_wait_ms=10, length_buckets=LENGTH_BUCKETS):
+        # tokenize_fn: list of texts -> token ids per text (called off the event loop)
+        # score_fn: (texts, token ids) -> one result per text (called off the event loop)
+        self.score_fn = score_fn
+        self.tokenize_fn = tokenize_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.length_buckets = tuple(sorted(length_buckets))
+
+        self._loop = None
+        self._pending = []
+        self._timer = None
+        self._running = False
+
+    async def submit(self, text):
+        """Queue a text for the next batch and wait for its own result"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Every asyncio.run gets a fresh loop, anything queued on the old one is gone
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._running = False
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None and not self._running:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # A running batch picks up whatever queued behind it when it finishes
+        if self._pending and not self._running:
+            self._running = True
+            self._loop.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, []
+                await self._run(pending)
+        finally:
+            self._running = False
+
+    def _bucket(self, pending, id_lists):
+        """Group pending requests by token length so short texts aren't padded to long ones"""
+        buckets = {}
+        for item, ids in zip(pending, id_lists):
+            buckets.setdefault(bisect.bisect_left(self.length_buckets, len(ids)), []).append((item, ids))
+        return [buckets[key] for key in sorted(buckets)]
+
+    async def _run(self, pending):
+        try:
+            # Tokenize once, the ids both pick the bucket and feed the forward pass
+            texts = [text for text, _ in pending]
+            id_lists = await self._loop.run_in_executor(None, self.tokenize_fn, texts)
+
+            for bucket in self._bucket(pending, id_lists):
+                for start in range(0, len(bucket), self.max_batch_size):
+                    chunk = bucket[start:start + self.max_batch_size]
+                    # Run the forward pass in a worker thread so the event loop keeps accepting requests
+                    results = await self._loop.run_in_executor(
+                        None, self.score_fn, [text for (text, _), _ in chunk], [ids for _, ids in chunk]
+                    )
+                    # zip() would leave the futures past the shorter side waiting forever
+                    if len(results) != len(chunk):
+                        raise ValueError(f"score_fn returned {len(results)} results for {len(chunk)} texts")
+
+                    for ((_, future), _), result in zip(chunk, results):
+                        if not future.done():
+                            future.set_result(result)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from queue import Empty
+import numpy as np
+import pandas as pd
+import torch
+
+CORPUS = "tests/output_sentiment.csv"
+PERCENTILES = (50, 95, 99)
+RESULT_POLL_SECONDS = 5  # How often run_isolated checks that its child is still alive
+
+
+def load_corpus(path=CORPUS, limit=None):
+    df = pd.read_csv(path)
+    items = [(row['Submission'], row['Comment'] if pd.notna(row.get('Comment')) else None) for _, row in df.iterrows()]
+    return items[:limit] if limit else items
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, ru_maxrss is KiB on Linux and bytes on macOS"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def score_all(agent, items, concurrency):
+    """Score every item with at most `concurrency` in flight, returns per-post latencies in seconds"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def score(post, comment):
+        async with semaphore:
+            start = time.perf_counter()
+            await agent.analyze_concurrent(post, comment)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(score(post, comment) for post, comment in items))
+    return latencies
+
+
+def run_config(config, items, options):
+    """Build a fresh agent for one configuration, score the corpus and measure it"""
+    from fake_llm import FakeChatModel
+    from hedging import Hedger
+    from sentiment_agent import SentimentAgent
+
+    llm = FakeChatModel(latency_ms=options["latency_ms"], latency_sigma=options["latency_sigma"], seed=options["seed"],
+                        prompt_cache_min_tokens=options["prompt_cache_min_tokens"])
+    with tempfile.TemporaryDirectory() as directory:
+        agent = SentimentAgent(
+            nlp_model=options["nlp_model"],
+            llm=llm,
+            backend=config["backend"],
+            max_batch_size=config["batch_size"],
+            cycles=config["cycles"],
+            prompt_layout=config["prompt_layout"],
+            hedger=Hedger() if config["hedge"] == "on" else None,
+            cache_path=os.path.join(directory, "cache.sqlite") if config["cache"] != "off" else None
+        )
+        agent.warmup()
+
+        # A warm cache has already seen the corpus once, e.g. a rerun after a crash
+        if config["cache"] == "warm":
+            asyncio.run(score_all(agent, items, config["concurrency"]))
+        requests_before = llm.fake.requests
+        usage_before = agent.usage.state()["total"]
+
+        start = time.perf_counter()
+        latencies = asyncio.run(score_all(agent, items, config["concurrency"]))
+        elapsed = time.perf_counter() - start
+        usage = agent.usage.state()["total"]
+        usage.subtract(usage_before)
+
+        if agent.cache is not None:
+            agent.cache.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    return dict(config, **{
+        "posts": len(items),
+        "elapsed_s": round(elapsed, 3),
+        "posts_per_sec": round(len(items) / elapsed, 3),
+        "latency_ms": {f"p{p}": round(float(np.percentile(latencies_ms, p)), 2) for p in PERCENTILES},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "llm_calls_per_post": round((llm.fake.requests - requests_before) / len(items), 3),
+        "llm_tokens_per_post": round((usage["input_tokens"] + usage["output_tokens"]) / len(items), 1),
+        "llm_cost_per_post_usd": round(usage["cost_usd"] / len(items), 6),
+        "llm_cached_ratio": round(usage["cached_tokens"] / usage["input_tokens"], 4) if usage["input_tokens"] else 0.0,
+        "llm_hedge_ratio": agent.hedger.report()["hedge_ratio"] if agent.hedger is not None else 0.0
+    })
+
+
+def _isolated(queue, config, items, options):
+    try:
+        queue.put(run_config(config, items, options))
+    except Exception as e:
+        queue.put(dict(config, error=f"{type(e).__name__}: {e}"))
+
+
+def run_isolated(config, items, options):
+    """Run one configuration in a fresh process so its peak RSS isn't inflated by earlier ones"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_isolated, args=(queue, config, items, options))
+    process.start()
+    # Get before join, a child blocks on exit until its queued result has been read
+    while True:
+        try:
+            result = queue.get(timeout=RESULT_POLL_SECONDS)
+            break
+        except Empty:
+            if process.is_alive():
+                continue
+        # The child is gone, its result may still be on the way through the pipe
+        try:
+            result = queue.get(timeout=RESULT_POLL_SECONDS)
+        except Empty:
+            # Killed (e.g. OOM) or crashed in native code without reaching _isolated's except
+            result = dict(config, error=f"benchmark process died with exit code {process.exitcode}")
+        break
+    process.join()
+    return result
+
+
+def matrix(batch_sizes, backends, cycles, concurrency, cache, prompt_layouts, hedge):
+    keys = ("batch_size", "backend", "cycles", "concurrency", "cache", "prompt_layout", "hedge")
+    values = itertools.product(batch_sizes, backends, cycles, concurrency, cache, prompt_layouts, hedge)
+    return [dict(zip(keys, config)) for config in values]
+
+
+def environment():
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+if __name__ == "__main__":
+    from sentiment_agent import SentimentAgent
+
+    parser = argparse.ArgumentParser(description="Benchmark SentimentAgent against the fake LLM over a config matrix")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--limit", type=int, help="only score the first N posts")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--nlp-model", default=SentimentAgent.MODEL)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[SentimentAgent.BATCH_SIZE])
+    parser.add_argument("--backends", nargs="+", default=["auto"])
+    parser.add_argument("--cycles", type=int, nargs="+", default=[SentimentAgent.CYCLES])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16])
+    parser.add_argument("--cache", nargs="+", choices=["off", "cold", "warm"], default=["off"])
+    parser.add_argument("--prompt-layouts", nargs="+", choices=["classic", "cached"], default=["classic"])
+    parser.add_argument("--hedge", nargs="+", choices=["off", "on"], default=["off"],
+                        help="duplicate LLM requests slower than the recent p95")
+    parser.add_argument("--prompt-cache-min-tokens", type=int, default=1024,
+                        help="shortest system prefix the fake LLM reports as cached")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median fake LLM latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--in-process", action="store_true",
+                        help="run every config in this process (faster, but peak RSS only ever grows)")
+    args = parser.parse_args()
+
+    items = load_corpus(args.corpus, args.limit)
+    options = {
+        "nlp_model": args.nlp_model,
+        "latency_ms": args.latency_ms,
+        "latency_sigma": args.latency_sigma,
+        "seed": args.seed,
+        "prompt_cache_min_tokens": args.prompt_cache_min_tokens
+    }
+
+    results = []
+    configs = matrix(args.batch_sizes, args.backends, args.cycles, args.concurrency, args.cache, args.prompt_layouts,
+                     args.hedge)
+    for config in configs:
+        result = (run_config if args.in_process else run_isolated)(config, items, options)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    report = json.dumps({
+        "environment": environment(),
+        "corpus": args.corpus,
+        "fake_llm": options,
+        "results": results
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import json
+import numpy as np
+from benchmark import load_corpus
+from distill import MANUAL_CSV, agreement, load_manual_labels, row_key
+
+
+async def score_layout(agent, items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def score(post, comment):
+        async with semaphore:
+            return (await agent.analyze_concurrent(post, comment)).score
+
+    return await asyncio.gather(*(score(post, comment) for post, comment in items))
+
+
+def compare(items, labels, layouts, agent_options, concurrency=8):
+    """Score the same labelled posts under each prompt layout
+
+    Agreement is against the manual labels, and against the first layout's scores as the
+    reference, next to what each layout cost and how much of its prompt the provider cached.
+    """
+    from sentiment_agent import SentimentAgent
+
+    scores = {}
+    report = {}
+    for layout in layouts:
+        agent = SentimentAgent(prompt_layout=layout, **agent_options)
+        scores[layout] = np.array(asyncio.run(score_layout(agent, items, concurrency)))
+
+        usage = agent.usage.summary(posts=len(items))
+        report[layout] = dict(
+            agreement(scores[layout], scores[layouts[0]], labels),
+            llm_cost_per_post_usd=usage["per_post"]["cost_usd"],
+            llm_cached_ratio=usage["total"]["cached_ratio"]
+        )
+    return report
+
+
+if __name__ == "__main__":
+    from sentiment_agent import SentimentAgent
+
+    parser = argparse.ArgumentParser(description="Compare prompt layouts on manually labelled posts")
+    parser.add_argument("--corpus", default=MANUAL_CSV, help="CSV with manual vneg..vpos labels")
+    parser.add_argument("--limit", type=int, help="only score the first N posts")
+    parser.add_argument("--layouts", nargs="+", choices=["classic", "cached"], default=["classic", "cached"],
+                        help="the first one is the reference for agent_mae and agent_pearson")
+    parser.add_argument("--model", default="o4-mini-2025-04-16")
+    parser.add_argument("--nlp-model", default=SentimentAgent.MODEL)
+    parser.add_argument("--openai-base-url", help="e.g. the fake_llm server, for a dry run")
+    parser.add_argument("--cycles", type=int, default=SentimentAgent.CYCLES)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    items = load_corpus(args.corpus, args.limit)
+    manual = load_manual_labels(args.corpus)
+    report = compare(
+        items,
+        [manual.get(row_key(post, comment)) for post, comment in items],
+        args.layouts,
+        {"model_name": args.model, "nlp_model": args.nlp_model, "openai_base_url": args.openai_base_url,
+         "cycles": args.cycles},
+        args.concurrency
+    )
+    print(json.dumps(report, indent=2))
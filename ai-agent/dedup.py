@@ -0,0 +1,123 @@
+import dataclasses
+import hashlib
+import re
+from collections import Counter
+
+
+def normalize(text):
+    """Case, links and whitespace don't change what the models see in a comment"""
+    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)  # Markdown links -> link text
+    text = re.sub(r'https?://\S+', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.casefold().strip()
+
+
+def simhash(text, bits=64):
+    """SimHash over word bigrams (character trigrams for very short texts), ignoring punctuation"""
+    words = re.findall(r"\w+", text)
+    if len(words) >= 3:
+        features = Counter(" ".join(pair) for pair in zip(words, words[1:]))
+    else:
+        features = Counter(text[i:i + 3] for i in range(max(1, len(text) - 2)))
+
+    weights = [0] * bits
+    for feature, count in features.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+class Deduplicator:
+    """Collapses a corpus to one representative per duplicate cluster and fans scores back out
+
+    Exact duplicates are matched after normalize(). With near_duplicates=True, texts of at least
+    min_words words are also clustered when their SimHashes differ in at most max_distance bits.
+    """
+
+    MAX_DISTANCE = 3
+    MIN_WORDS = 5
+    BANDS = 4  # max_distance < BANDS guarantees near duplicates share at least one band
+
+    def __init__(self, near_duplicates=False, max_distance=MAX_DISTANCE, min_words=MIN_WORDS):
+        if near_duplicates and max_distance >= self.BANDS:
+            raise ValueError(f"max_distance must be below {self.BANDS} for banded SimHash lookup")
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.min_words = min_words
+        self.assignment = []
+        self.stats = Counter()
+
+    def _bands(self, fingerprint):
+        width = 64 // self.BANDS
+        return [(band, fingerprint >> (band * width) & ((1 << width) - 1)) for band in range(self.BANDS)]
+
+    def _nearest(self, fingerprint, fingerprints, band_index):
+        """First earlier cluster within max_distance bits, only checking clusters that share a band"""
+        candidates = {cluster for band in self._bands(fingerprint) for cluster in band_index.get(band, ())}
+        for cluster in sorted(candidates):
+            if bin(fingerprints[cluster] ^ fingerprint).count("1") <= self.max_distance:
+                return cluster
+        return None
+
+    def collapse(self, texts):
+        """Indices of the representative texts; assignment maps every text to its representative"""
+        representatives = []
+        exact = {}
+        band_index = {}
+        fingerprints = []
+        self.assignment = []
+
+        for i, text in enumerate(texts):
+            key = normalize(text)
+            if key in exact:
+                self.assignment.append(exact[key])
+                self.stats["exact"] += 1
+                continue
+
+            cluster = None
+            fingerprint = None
+            if self.near_duplicates and len(key.split()) >= self.min_words:
+                fingerprint = simhash(key)
+                cluster = self._nearest(fingerprint, fingerprints, band_index)
+                if cluster is not None:
+                    self.stats["near"] += 1
+
+            if cluster is None:
+                cluster = len(representatives)
+                representatives.append(i)
+                fingerprints.append(fingerprint)
+                if fingerprint is not None:
+                    for band in self._bands(fingerprint):
+                        band_index.setdefault(band, []).append(cluster)
+
+            exact[key] = cluster
+            self.assignment.append(cluster)
+
+        self.stats["total"] += len(texts)
+        self.stats["representatives"] += len(representatives)
+        return representatives
+
+    def expand(self, results):
+        """One result per original text, from one result per representative"""
+        expanded = []
+        for cluster in self.assignment:
+            result = results[cluster]
+            expanded.append(dataclasses.replace(result) if dataclasses.is_dataclass(result) else result)
+        return expanded
+
+    @property
+    def ratio(self):
+        """Share of texts that didn't need scoring"""
+        if not self.stats["total"]:
+            return 0.0
+        return 1 - self.stats["representatives"] / self.stats["total"]
+
+    def report(self):
+        return {
+            "total": self.stats["total"],
+            "scored": self.stats["representatives"],
+            "exact_duplicates": self.stats["exact"],
+            "near_duplicates": self.stats["near"],
+            "dedup_ratio": round(self.ratio, 4)
+        }
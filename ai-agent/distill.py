@@ -0,0 +1,187 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+
+DISTILL_CSVS = ("tests/distill_agent_sentiment_output.csv", "tests/agent_results.csv")
+MANUAL_CSV = "tests/output_sentiment.csv"
+TARGET_COLUMNS = ("predicted_sentiment_score", "Agent Sentiment")
+LABELS = ("vneg", "neg", "neu", "pos", "vpos")
+ALPHAS = (0.1, 1.0, 10.0, 100.0, 1000.0)
+
+
+def categorize(score):
+    """Same bins as tests/graph.py"""
+    if score <= 9:
+        return 'vneg'
+    elif score < 30:
+        return 'neg'
+    elif score < 70:
+        return 'neu'
+    elif score < 90:
+        return 'pos'
+    return 'vpos'
+
+
+def row_key(post, comment):
+    return post, comment if isinstance(comment, str) else None
+
+
+def load_targets(paths):
+    """Agent-refined scores per (post, comment), averaged over the files that score the same row"""
+    targets = {}
+    for path in paths:
+        df = pd.read_csv(path)
+        df.columns = [column.strip() for column in df.columns]
+        column = next((c for c in TARGET_COLUMNS if c in df.columns), None)
+        if column is None:
+            raise ValueError(f"{path} has none of the agent score columns {TARGET_COLUMNS}")
+
+        for _, row in df.iterrows():
+            if pd.notna(row[column]):
+                targets.setdefault(row_key(row['Submission'], row.get('Comment')), []).append(float(row[column]))
+
+    items = list(targets)
+    return items, np.array([np.mean(targets[item]) for item in items], dtype=np.float64)
+
+
+def load_manual_labels(path=MANUAL_CSV):
+    df = pd.read_csv(path)
+    return {row_key(row['Submission'], row.get('Comment')): row['Sentiment Score'] for _, row in df.iterrows()}
+
+
+def features(probabilities, embeddings):
+    """Encoder probabilities next to the pooled embedding, the head's only inputs"""
+    return np.hstack([probabilities, embeddings]).astype(np.float64)
+
+
+class DistilledHead:
+    """Ridge regression from frozen encoder features to the agent's refined 0-100 score"""
+
+    def __init__(self, mean, scale, weights, bias, alpha, namespace=""):
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights
+        self.bias = bias
+        self.alpha = alpha
+        self.namespace = namespace  # Encoder the features came from, a head is useless on any other
+
+    @staticmethod
+    def solve(x, y, alpha):
+        """Closed-form ridge on standardized features, the bias is left unpenalized"""
+        mean = x.mean(axis=0)
+        scale = np.maximum(x.std(axis=0), 1e-6)
+        z = (x - mean) / scale
+        bias = y.mean()
+        weights = np.linalg.solve(z.T @ z + alpha * np.eye(z.shape[1]), z.T @ (y - bias))
+        return mean, scale, weights, bias
+
+    @classmethod
+    def fit(cls, x, y, alpha, namespace=""):
+        return cls(*cls.solve(x, y, alpha), alpha=alpha, namespace=namespace)
+
+    @classmethod
+    def cross_validate(cls, x, y, alphas=ALPHAS, folds=5, seed=0):
+        """Out-of-fold predictions for every alpha, picks the one with the lowest MAE"""
+        order = np.random.default_rng(seed).permutation(len(y))
+        splits = np.array_split(order, min(folds, len(y)))
+
+        best = None
+        for alpha in alphas:
+            predictions = np.empty(len(y))
+            for held_out in splits:
+                train = np.setdiff1d(order, held_out)
+                mean, scale, weights, bias = cls.solve(x[train], y[train], alpha)
+                predictions[held_out] = (x[held_out] - mean) / scale @ weights + bias
+            predictions = np.clip(predictions, 0, 100)
+            error = np.abs(predictions - y).mean()
+            if best is None or error < best[1]:
+                best = (alpha, error, predictions)
+        return best
+
+    def predict(self, x):
+        return np.clip((x - self.mean) / self.scale @ self.weights + self.bias, 0, 100)
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias,
+                 alpha=self.alpha, namespace=np.array(self.namespace))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["mean"], data["scale"], data["weights"], float(data["bias"]), float(data["alpha"]),
+                       namespace=str(data["namespace"]))
+
+
+def agreement(predicted, agent_scores, manual_labels):
+    """How closely predictions track the agent's scores and the manual five-way labels"""
+    predicted = np.asarray(predicted, dtype=np.float64)
+    agent_scores = np.asarray(agent_scores, dtype=np.float64)
+    categories = [categorize(score) for score in predicted]
+
+    report = {
+        "rows": len(predicted),
+        "agent_mae": round(float(np.abs(predicted - agent_scores).mean()), 2),
+        "agent_pearson": round(float(np.corrcoef(predicted, agent_scores)[0, 1]), 4) if len(predicted) > 1 else None,
+        "agent_category_match": round(float(np.mean(
+            [category == categorize(score) for category, score in zip(categories, agent_scores)]
+        )), 4)
+    }
+
+    labelled = [(category, label) for category, label in zip(categories, manual_labels) if label in LABELS]
+    if labelled:
+        distance = [abs(LABELS.index(category) - LABELS.index(label)) for category, label in labelled]
+        report["manual_rows"] = len(labelled)
+        report["manual_exact"] = round(float(np.mean([d == 0 for d in distance])), 4)
+        report["manual_within_one"] = round(float(np.mean([d <= 1 for d in distance])), 4)
+    return report
+
+
+def encode(encoder, items, batch_size=32):
+    """Encoder probabilities and head features for (post, comment) pairs"""
+    from sentiment_agent import SentimentAgent
+
+    texts = [SentimentAgent.format_input(post, comment) for post, comment in items]
+    outputs = [encoder.probabilities(texts[start:start + batch_size], embeddings=True)
+               for start in range(0, len(texts), batch_size)]
+    probabilities = np.concatenate([output[0] for output in outputs])
+    embeddings = np.concatenate([output[1] for output in outputs])
+    return probabilities, features(probabilities, embeddings)
+
+
+def train(encoder, paths=DISTILL_CSVS, manual_csv=MANUAL_CSV, alphas=ALPHAS):
+    """Fit a head on the agent's scores, returns it with cross-validated agreement reports
+
+    The reports use out-of-fold predictions, next to the raw encoder score as a baseline.
+    """
+    items, targets = load_targets(paths)
+    probabilities, x = encode(encoder, items)
+    alpha, _, predictions = DistilledHead.cross_validate(x, targets, alphas)
+    head = DistilledHead.fit(x, targets, alpha, namespace=encoder.nlp_model)
+
+    manual = load_manual_labels(manual_csv)
+    labels = [manual.get(item) for item in items]
+    return head, {
+        "alpha": alpha,
+        "distilled": agreement(predictions, targets, labels),
+        "encoder_baseline": agreement(probabilities[:, 2] * 100, targets, labels),
+        "agent_vs_manual": agreement(targets, targets, labels)
+    }
+
+
+if __name__ == "__main__":
+    from encoders import get_encoder
+    from sentiment_agent import SentimentAgent
+
+    parser = argparse.ArgumentParser(description="Train an LLM-free scoring head on agent-refined scores")
+    parser.add_argument("output", nargs="?", default="distilled_head.npz")
+    parser.add_argument("--data", nargs="+", default=list(DISTILL_CSVS), help="CSVs with agent scores")
+    parser.add_argument("--manual", default=MANUAL_CSV, help="CSV with manual vneg..vpos labels")
+    parser.add_argument("--nlp-model", default=SentimentAgent.MODEL, help="encoder to train the head on")
+    parser.add_argument("--backend", default="auto")
+    args = parser.parse_args()
+
+    head, report = train(get_encoder(args.backend, args.nlp_model), args.data, args.manual)
+    head.save(args.output)
+    print(json.dumps(report, indent=2))
+    print(f"Saved head to {args.output}, score with SentimentAgent(refinement='distilled', distilled_head=...)")
@@ -0,0 +1,348 @@
+from transformers import AutoTokenizer
+from transformers import AutoModelForSequenceClassification
+from transformers import BatchEncoding
+from transformers.utils import cached_file
+from scipy.special import softmax
+import numpy as np
+import torch
+import hashlib
+import logging
+import os
+import threading
+
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jester", "onnx")
+
+# Loaded encoders shared by every agent in the process, keyed by (model, backend, device)
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def physical_cores():
+    """Best guess at physical cores, intra-op threads on hyperthreads mostly fight each other"""
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def model_fingerprint(nlp_model):
+    """Short hash of the model's config and weight files, a new local checkpoint or hub revision changes it
+
+    Weights are identified by file name, size and modification time rather than read in full.
+    Hub snapshots link to blobs named after their content hash, so a new revision changes the name.
+    """
+    config_path = cached_file(nlp_model, "config.json")
+    directory = os.path.dirname(config_path)
+    digest = hashlib.sha256()
+    with open(config_path, "rb") as f:
+        digest.update(f.read())
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".safetensors", ".bin")):
+            path = os.path.realpath(os.path.join(directory, name))
+            stat = os.stat(path)
+            digest.update(f"{name}|{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class Encoder:
+    """Owns the tokenizer and model for one backend and turns token batches into logits"""
+
+    backend = None
+    WARMUP_BATCH = 8
+    MAX_LENGTH = 512  # 514 positions minus RoBERTa's padding offset
+
+    def __init__(self, nlp_model, num_threads=None, device=None):
+        self.nlp_model = nlp_model
+        self.num_threads = num_threads or physical_cores()
+        self.device = torch.device(device or "cpu")
+        self.warm = False
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            nlp_model,
+            truncation=True,
+            max_length=514
+        )
+        # Fast tokenizers switch padding/truncation on shared state for every call, so calls from
+        # the event loop (bucketing) and executor threads (forward passes) must not overlap
+        self.tokenizer_lock = threading.Lock()
+
+    def tokenize(self, texts, **kwargs):
+        with self.tokenizer_lock:
+            return self.tokenizer(list(texts), **kwargs)
+
+    def forward(self, encoded, embeddings=False):
+        """Raw logits, plus pooled (<s> token) embeddings if asked (else None), for a padded batch"""
+        raise NotImplementedError
+
+    def logits(self, encoded):
+        return self.forward(encoded)[0]
+
+    def outputs(self, encoded, embeddings=False):
+        logits, pooled = self.forward(encoded, embeddings)
+        probabilities = softmax(logits, axis=-1)
+        return (probabilities, pooled) if embeddings else probabilities
+
+    def encode(self, texts):
+        """Padded, truncated tensor batch ready for forward()"""
+        return self.tokenize(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.MAX_LENGTH,
+            return_tensors='pt'
+        )
+
+    def probabilities(self, texts, embeddings=False):
+        """Softmax over the label dimension for every text, plus the pooled embeddings if asked"""
+        return self.outputs(self.encode(texts), embeddings)
+
+    def collate(self, id_lists):
+        """Pad pre-tokenized ids into a batch, truncating like the tokenizer would"""
+        eos = self.tokenizer.eos_token_id
+        id_lists = [ids if len(ids) <= self.MAX_LENGTH else np.append(ids[:self.MAX_LENGTH - 1], eos)
+                    for ids in id_lists]
+        width = max(len(ids) for ids in id_lists)
+
+        input_ids = np.full((len(id_lists), width), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(id_lists), width), dtype=np.int64)
+        for row, ids in enumerate(id_lists):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+
+        return BatchEncoding({
+            "input_ids": torch.from_numpy(input_ids),
+            "attention_mask": torch.from_numpy(attention_mask)
+        })
+
+    def probabilities_from_ids(self, id_lists, embeddings=False):
+        """Same as probabilities() for texts that were tokenized ahead of time"""
+        return self.outputs(self.collate(id_lists), embeddings)
+
+    def set_threads(self, num_threads):
+        """Change the intra-op thread count, e.g. in a forked worker that owns a slice of the cores"""
+        self.num_threads = num_threads
+
+    def warmup(self, batch_size=WARMUP_BATCH):
+        """Run a dummy batch so allocation and kernel selection happen before real traffic"""
+        if not self.warm:
+            self.probabilities(["warmup " * 16] * batch_size)
+            self.warm = True
+
+
+class TorchEncoder(Encoder):
+    """Eager PyTorch fp32, the safe default on CPU"""
+
+    backend = "fp32"
+
+    def __init__(self, nlp_model, num_threads=None, device=None):
+        super().__init__(nlp_model, num_threads, device)
+        self.model = self.load_model(nlp_model)
+        self.model.eval()
+        self.device = self.model.device
+
+        # The classifier head already gets the <s> vector, so grab its input instead of asking the
+        # model for every layer's hidden states. Thread-local, forward passes may run in parallel.
+        self._captured = threading.local()
+        self.model.classifier.register_forward_hook(self._capture)
+
+    def load_model(self, nlp_model):
+        model = AutoModelForSequenceClassification.from_pretrained(nlp_model, torch_dtype=torch.float32)
+        return model.to(self.device)
+
+    def _capture(self, module, inputs, output):
+        if getattr(self._captured, "wanted", False):
+            self._captured.features = inputs[0]
+
+    def forward(self, encoded, embeddings=False):
+        # set_num_threads is process wide, so only touch it when backends disagree
+        if self.device.type == "cpu" and torch.get_num_threads() != self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        self._captured.wanted = embeddings
+        try:
+            with torch.inference_mode():
+                output = self.model(**encoded.to(self.device))
+            logits = output.logits.float().cpu().numpy()
+            if not embeddings:
+                return logits, None
+
+            # RoBERTa-style heads take the whole sequence and read position 0, BERT-style the pooled vector
+            features = self._captured.features
+            pooled = features[:, 0] if features.dim() == 3 else features
+            return logits, pooled.float().cpu().numpy()
+        finally:
+            self._captured.wanted = False
+            self._captured.features = None
+
+
+class HalfEncoder(TorchEncoder):
+    """fp16 with accelerate placement, only worth it on GPU"""
+
+    backend = "fp16"
+
+    def load_model(self, nlp_model):
+        return AutoModelForSequenceClassification.from_pretrained(
+            nlp_model,
+            device_map="auto",
+            torch_dtype=torch.float16
+        )
+
+
+class QuantizedEncoder(TorchEncoder):
+    """Dynamic int8 quantization of the Linear layers, CPU only"""
+
+    backend = "int8"
+
+    def load_model(self, nlp_model):
+        model = AutoModelForSequenceClassification.from_pretrained(nlp_model, torch_dtype=torch.float32)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class PooledOutput(torch.nn.Module):
+    """Classifier wrapper whose traced graph returns the pooled embedding next to the logits"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        output = self.model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True,
+                            return_dict=True)
+        return output.logits, output.hidden_states[-1][:, 0]
+
+
+class OnnxEncoder(Encoder):
+    """Exported ONNX graph run through ONNX Runtime"""
+
+    backend = "onnx"
+    EXPORT_VERSION = 2  # Bumped whenever the graph's outputs change, older exports are ignored
+
+    def __init__(self, nlp_model, num_threads=None, device=None, cache_dir=ONNX_CACHE_DIR):
+        super().__init__(nlp_model, num_threads, device)
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime onnx)") from e
+
+        # Keyed on the exact model files too, so a changed checkpoint gets a fresh export
+        name = f"{nlp_model.replace('/', '--')}.v{self.EXPORT_VERSION}.{model_fingerprint(nlp_model)}.onnx"
+        self.path = os.path.join(cache_dir, name)
+        if not os.path.exists(self.path):
+            self.export(nlp_model, self.path)
+        self.open_session()
+
+    def open_session(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+
+    def set_threads(self, num_threads):
+        # Thread count is fixed per session, and a session's thread pool doesn't survive fork anyway
+        super().set_threads(num_threads)
+        self.open_session()
+
+    def export(self, nlp_model, path):
+        """One-time export of the fp32 model with dynamic batch and sequence axes"""
+        logging.info(f"Exporting {nlp_model} to {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        model = AutoModelForSequenceClassification.from_pretrained(nlp_model, torch_dtype=torch.float32)
+        model.eval()
+        dummy = self.tokenizer(["warmup"], return_tensors='pt')
+
+        # Write to a temp name first so a crashed export never leaves a half file behind
+        tmp_path = path + ".tmp"
+        torch.onnx.export(
+            PooledOutput(model),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            tmp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits", "embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+                "embedding": {0: "batch"}
+            },
+            opset_version=17,
+            dynamo=False
+        )
+        os.replace(tmp_path, path)
+
+    def forward(self, encoded, embeddings=False):
+        inputs = {
+            "input_ids": encoded["input_ids"].numpy().astype(np.int64),
+            "attention_mask": encoded["attention_mask"].numpy().astype(np.int64)
+        }
+        if not embeddings:
+            return self.session.run(["logits"], inputs)[0], None
+        logits, pooled = self.session.run(["logits", "embedding"], inputs)
+        return logits, pooled
+
+
+BACKENDS = {
+    encoder.backend: encoder
+    for encoder in (TorchEncoder, HalfEncoder, QuantizedEncoder, OnnxEncoder)
+}
+
+
+def resolve_backend(backend):
+    """'auto' keeps the old fp16 path on GPU and uses fp32 everywhere else"""
+    if backend == "auto":
+        return "fp16" if torch.cuda.is_available() else "fp32"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {sorted(BACKENDS)} or 'auto'")
+    return backend
+
+
+def resolve_device(backend, device=None):
+    """fp16 lets accelerate place the model, int8 and onnx here only run on CPU"""
+    if backend == "fp16":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if backend in ("int8", "onnx"):
+        return "cpu"
+    return device or "cpu"
+
+
+def load_encoder(backend, nlp_model, num_threads=None, device=None):
+    backend = resolve_backend(backend)
+    return BACKENDS[backend](nlp_model, num_threads=num_threads, device=resolve_device(backend, device))
+
+
+def get_encoder(backend, nlp_model, num_threads=None, device=None):
+    """Load each (model, backend, device) once per process and hand out the shared instance
+
+    A later caller asking for a different num_threads changes it on the shared instance, which
+    affects every agent using it.
+    """
+    backend = resolve_backend(backend)
+    key = (nlp_model, backend, resolve_device(backend, device))
+
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = load_encoder(backend, nlp_model, num_threads=num_threads, device=key[2])
+        encoder = _registry[key]
+        if num_threads and num_threads != encoder.num_threads:
+            logging.warning(f"Shared {backend} encoder for {nlp_model}: num_threads {encoder.num_threads} -> {num_threads}")
+            encoder.set_threads(num_threads)
+        return encoder
+
+
+def clear_encoders():
+    """Drop every cached encoder, mostly useful to free memory between experiments"""
+    with _registry_lock:
+        _registry.clear()
+
+
+def parity_report(reference, others, texts, label=2):
+    """Difference in positive-class score (0-100) between a reference encoder and the others"""
+    expected = reference.probabilities(texts)[:, label] * 100
+
+    report = {}
+    for encoder in others:
+        diff = np.abs(encoder.probabilities(texts)[:, label] * 100 - expected)
+        report[encoder.backend] = {
+            "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+            "mean_abs_diff": float(diff.mean()) if len(diff) else 0.0
+        }
+    return report
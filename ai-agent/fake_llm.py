@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from prompts import ASPECTS
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class FakeServerError(Exception):
+    status_code = 500
+
+
+def stable_target(text):
+    """Deterministic 'true' score for a piece of text"""
+    return int(hashlib.sha256(text.strip().encode("utf-8")).hexdigest(), 16) % 101
+
+
+class FakeLLM:
+    """Deterministic scores with a configurable latency distribution, error rate and 429 bursts
+
+    Replies move each current score halfway towards a target derived from the text, so refinement
+    converges the same way on every run. Latencies are lognormal around latency_ms.
+    """
+
+    def __init__(self, latency_ms=200.0, latency_sigma=0.5, error_rate=0.0, burst_every=0, burst_length=0,
+                 seed=0, prompt_cache_min_tokens=1024):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.burst_every = burst_every    # every burst_every requests...
+        self.burst_length = burst_length  # ...the next burst_length get a 429
+        self.rng = random.Random(seed)
+        # Like OpenAI, a repeated system prefix is reported as cached once it's long enough
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+        self.seen_prefixes = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def next_outcome(self):
+        """Latency in seconds and the error to raise (or None) for the next request"""
+        with self._lock:
+            self.requests += 1
+            n = self.requests
+            delay = self.latency_ms / 1000 * self.rng.lognormvariate(0, self.latency_sigma) if self.latency_ms else 0
+            failed = self.rng.random() < self.error_rate
+
+        if self.burst_every and n % self.burst_every < self.burst_length:
+            return delay / 10, FakeRateLimitError("Rate limit reached (fake)")
+        if failed:
+            return delay, FakeServerError("Internal server error (fake)")
+        return delay, None
+
+    def reply(self, prompt_text):
+        """Answer in whatever format the prompt asks for: one integer, a JSON array or a JSON object"""
+        if "Each item below" in prompt_text:
+            items = re.findall(r"Item (\d+):\n(.*?)\nCurrent Score: ([\d.]+)", prompt_text, re.DOTALL)
+            return json.dumps([
+                {"id": int(item_id), "score": self.adjust(text, float(score))} for item_id, text, score in items
+            ])
+
+        match = re.search(r"\n\n(.*)\nCurrent Score: ([\d.]+)", prompt_text, re.DOTALL)
+        text, score = (match.group(1).split("\n\n")[-1], float(match.group(2))) if match else (prompt_text, 50.0)
+        if "JSON object" in prompt_text:
+            return json.dumps({name: self.adjust(name + text, score) for name in ASPECTS})
+        return str(self.adjust(text, score))
+
+    @staticmethod
+    def adjust(text, score):
+        return round(score + (stable_target(text) - score) / 2)
+
+    def usage(self, prompt_text, reply, prefix=None):
+        """Rough token counts in the shape langchain reports them, prefix is the system message if any"""
+        input_tokens = len(prompt_text) // 4
+        output_tokens = max(1, len(reply) // 4)
+
+        cached = 0
+        if prefix:
+            with self._lock:
+                if prefix in self.seen_prefixes and len(prefix) // 4 >= self.prompt_cache_min_tokens:
+                    cached = len(prefix) // 4
+                self.seen_prefixes.add(prefix)
+
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens, "input_token_details": {"cache_read": cached}}
+
+
+class FakeChatModel(BaseChatModel):
+    """In-process LangChain chat model backed by FakeLLM, e.g. SentimentAgent(llm=FakeChatModel())"""
+
+    fake: Any = None
+
+    def __init__(self, fake=None, **kwargs):
+        super().__init__(fake=fake or FakeLLM(**kwargs))
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _respond(self, messages):
+        prompt_text = "\n".join(str(message.content) for message in messages)
+        prefix = str(messages[0].content) if messages and messages[0].type == "system" else None
+        reply = self.fake.reply(prompt_text)
+        message = AIMessage(content=reply, usage_metadata=self.fake.usage(prompt_text, reply, prefix))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self.fake.next_outcome()
+        time.sleep(delay)
+        if error:
+            raise error
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self.fake.next_outcome()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return self._respond(messages)
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    """Just enough of POST /v1/chat/completions for ChatOpenAI"""
+
+    fake = None
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        delay, error = self.fake.next_outcome()
+        time.sleep(delay)
+        if error:
+            self.send_json(error.status_code, {"error": {"message": str(error), "type": type(error).__name__}})
+            return
+
+        messages = body.get("messages", [])
+        prompt_text = "\n".join(str(message.get("content", "")) for message in messages)
+        system = messages and messages[0].get("role") in ("system", "developer")
+        reply = self.fake.reply(prompt_text)
+        usage = self.fake.usage(prompt_text, reply, str(messages[0].get("content", "")) if system else None)
+        self.send_json(200, {
+            "id": f"chatcmpl-fake-{self.fake.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"],
+                "prompt_tokens_details": {"cached_tokens": usage["input_token_details"]["cache_read"]}
+            }
+        })
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Benchmarks make thousands of requests, keep stderr quiet
+
+
+def serve(host="127.0.0.1", port=8808, fake=None, background=False):
+    """Serve chat completions from FakeLLM, point the agent at it with openai_base_url=http://host:port/v1"""
+    handler = type("Handler", (ChatCompletionsHandler,), {"fake": fake or FakeLLM()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=int, default=0)
+    parser.add_argument("--burst-length", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prompt-cache-min-tokens", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1")
+    serve(args.host, args.port, FakeLLM(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        seed=args.seed,
+        prompt_cache_min_tokens=args.prompt_cache_min_tokens
+    ))
@@ -0,0 +1,123 @@
+import asyncio
+from collections import Counter, deque
+import numpy as np
+
+
+class NoHedgeSlot(Exception):
+    """Raised by a hedge request that found no free hedge slot after all, its primary just carries on"""
+
+
+class Hedger:
+    """Sends a duplicate of a slow LLM request and keeps whichever answer comes back first
+
+    The hedge delay is a high percentile of the recent latencies of the same chain and model, so
+    only the slowest few percent of requests get a duplicate. The loser is cancelled, and hedges
+    are capped at max_ratio of all requests so a provider-wide slowdown can't double the spend.
+    A cancelled request may still be billed for whatever the provider already processed.
+    """
+
+    QUANTILE = 0.95
+    WINDOW = 200        # Recent latencies kept per chain and model
+    MIN_SAMPLES = 20    # No hedging until the percentile means something
+    MIN_DELAY = 0.05    # seconds, never hedge sooner than this
+    MAX_RATIO = 0.1     # Hedges per request, over the whole run
+
+    def __init__(self, quantile=QUANTILE, window=WINDOW, min_samples=MIN_SAMPLES, min_delay=MIN_DELAY,
+                 max_ratio=MAX_RATIO, metrics=None):
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.metrics = metrics
+        self.latencies = {}
+        self.stats = Counter()
+
+    def observe(self, key, latency):
+        """Record the latency of a request that completed, hedge or not"""
+        self.latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def delay(self, key):
+        """Seconds to wait before hedging, None while there are too few samples"""
+        latencies = self.latencies.get(key)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, float(np.quantile(latencies, self.quantile)))
+
+    def within_budget(self):
+        """Whether one more hedge fits the budget, it is only charged once the hedge holds a slot"""
+        if self.stats["hedged"] + 1 > self.max_ratio * self.stats["requests"]:
+            self.stats["budget_denied"] += 1
+            return False
+        return True
+
+    def count(self, event, key):
+        self.stats[event] += 1
+        if self.metrics is not None:
+            self.metrics.increment("llm_hedges", chain=key[0], outcome=event)
+
+    async def run(self, key, request, spare=None):
+        """Await request(sent, False), hedging it with request(sent, True) once it runs past the delay
+
+        request must set the sent event, when given, once the call actually goes out so time spent
+        queueing for a limiter slot doesn't count as the provider being slow. A hedge never queues:
+        it takes a free slot right away and sets its own sent event, or raises NoHedgeSlot. spare()
+        says whether a hedge could go out right now, e.g. the limiter's hedge slots.
+        """
+        self.stats["requests"] += 1
+        delay = self.delay(key)
+        if delay is None:
+            return await request(None, False)
+
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(request(sent, False))
+        hedge = None
+        try:
+            waiter = asyncio.ensure_future(sent.wait())
+            try:
+                await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or (spare is not None and not spare()) or not self.within_budget():
+                return await primary
+
+            hedge_sent = asyncio.Event()
+            hedge = asyncio.ensure_future(request(hedge_sent, True))
+            waiter = asyncio.ensure_future(hedge_sent.wait())
+            try:
+                await asyncio.wait({hedge, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if not hedge_sent.is_set():
+                # Another hedge took the last slot since spare() said yes, nothing went out
+                if isinstance(hedge.exception(), NoHedgeSlot):
+                    self.stats["no_slot"] += 1
+                return await primary
+            self.stats["hedged"] += 1
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.count("won" if task is hedge else "lost", key)
+                        return task.result()
+            # Both failed, the caller's retry logic decides what happens next based on the primary's error
+            self.count("failed", key)
+            raise primary.exception()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def report(self):
+        hedged = self.stats["hedged"]
+        return {
+            "requests": self.stats["requests"],
+            "hedged": hedged,
+            "hedge_ratio": round(hedged / self.stats["requests"], 4) if self.stats["requests"] else 0.0,
+            "hedge_wins": self.stats["won"],
+            "budget_denied": self.stats["budget_denied"]
+        }
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "jester", "llm_cache.sqlite")
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different copies of a comment share a key"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def prompt_fingerprint(prompts):
+    """Hash of the prompt templates, cached responses from older prompts are never reused"""
+    digest = hashlib.sha256()
+    for prompt in prompts:
+        digest.update(prompt.pretty_repr().encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """SQLite-backed cache of parsed chain scores with LRU eviction and single-flight lookups"""
+
+    MAX_ENTRIES = 100_000
+    SCORE_STEP = 1.0
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, namespace="", max_entries=MAX_ENTRIES, score_step=SCORE_STEP):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.score_step = score_step
+        self.stats = Counter()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connect()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, score REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+        # Prompts changed since the cache was written, nothing in it is valid any more
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'namespace'").fetchone()
+        if row is None or row[0] != namespace:
+            self.invalidate()
+
+        self._inflight = {}
+        self._loop = None
+
+    def connect(self):
+        """(Re)open the database, a connection must not be shared with a forked child"""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def quantize(self, score):
+        """Snap the input score to the cache grid, callers should send this value to the LLM too"""
+        if not self.score_step:
+            return score
+        return round(score / self.score_step) * self.score_step
+
+    def key(self, chain_name, model_name, input_text, score):
+        text_hash = hashlib.sha256(normalize_text(input_text).encode("utf-8")).hexdigest()
+        return f"{chain_name}|{model_name}|{text_hash}|{self.quantize(score):.2f}"
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT score FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        self.stats["hits"] += 1
+        return row[0]
+
+    def set(self, key, score):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, score, last_used) VALUES (?, ?, ?)",
+                (key, score, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used rows once the table grows past max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            self.stats["evictions"] += count - self.max_entries
+
+    def invalidate(self):
+        """Forget every cached response, e.g. after editing prompts.py"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('namespace', ?)", (self.namespace,)
+            )
+            self._conn.commit()
+
+    async def get_or_compute(self, key, compute):
+        """Return the cached score, or run compute() once for every concurrent caller with this key
+
+        compute() returns (score, cacheable); fallback scores from failed calls are shared with the
+        callers already waiting but never written to disk.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._inflight = {}
+
+        if key in self._inflight:
+            self.stats["joined"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            score, cacheable = await compute()
+            if cacheable:
+                self.set(key, score)
+            future.set_result(score)
+            return score
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting on it, don't let asyncio complain about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
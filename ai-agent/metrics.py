@@ -0,0 +1,187 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached forward pass up to a request that ran into the 60s timeout
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "jester"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense, plus min and max"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation, max for the +Inf bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.counts)}
+        }
+
+
+def format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Stage timings and event counts for one agent, shared by the event loop and executor threads
+
+    Every observation is also passed to the registered hooks as hook(name, value, labels), e.g. to
+    forward it to StatsD or log slow chain calls.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+        for hook in self.hooks:
+            hook(name, value, labels)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        for hook in self.hooks:
+            hook(name, amount, labels)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Time a block into the stage_seconds histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def state(self):
+        """Plain copies of every histogram and counter, e.g. to send a forked worker's metrics back"""
+        with self._lock:
+            return {
+                "histograms": {key: vars(histogram).copy() for key, histogram in self.histograms.items()},
+                "counters": dict(self.counters)
+            }
+
+    def merge(self, state):
+        """Add another Metrics' state() to this one, hooks are not called again"""
+        with self._lock:
+            for key, other in state["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(other["buckets"])
+                histogram.counts = [a + b for a, b in zip(histogram.counts, other["counts"])]
+                histogram.count += other["count"]
+                histogram.sum += other["sum"]
+                for bound, pick in (("min", min), ("max", max)):
+                    values = [value for value in (getattr(histogram, bound), other[bound]) if value is not None]
+                    setattr(histogram, bound, pick(values) if values else None)
+            for key, value in state["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def to_dict(self):
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        return {
+            "histograms": [dict(name=name, labels=dict(labels), **histogram.to_dict())
+                           for (name, labels), histogram in histograms],
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in counters]
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Text exposition format, for node_exporter's textfile collector"""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Dump to path, Prometheus textfile format for .prom and JSON for anything else"""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json() + "\n"
+        # The textfile collector may read at any moment, never let it see half a file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import numpy as np
+import torch
+from encoders import physical_cores
+
+# Set in the parent right before forking, workers inherit the loaded model copy-on-write
+_worker_agent = None
+_worker_options = {}
+
+
+def _init_worker(num_threads, workers):
+    """Pin intra-op threads so workers don't oversubscribe the cores between them"""
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    torch.set_num_threads(num_threads)
+    _worker_agent.encoder.set_threads(num_threads)
+
+    # The provider's rate limits apply to all workers together
+    _worker_agent.limiter.split(workers)
+
+    # The SQLite connection belongs to the parent, every worker opens its own
+    if _worker_agent.cache is not None:
+        _worker_agent.cache.connect()
+
+    # Workers read the token cache the parent filled, but never append to it concurrently
+    if _worker_agent.token_cache is not None:
+        _worker_agent.token_cache.read_only = True
+
+
+def _counters(agent):
+    """Stats counters a worker fills in, by attribute path on the agent"""
+    counters = {
+        "gate_stats": agent.gate_stats,
+        "llm_stats": agent.llm_stats,
+        "limiter.stats": agent.limiter.stats
+    }
+    for name in ("cache", "router", "hedger", "reuse_index"):
+        if getattr(agent, name) is not None:
+            counters[f"{name}.stats"] = getattr(agent, name).stats
+    return counters
+
+
+def _score_shard(items):
+    # Workers start from the parent's counts and may get more than one shard, only send back this shard's
+    counters = _counters(_worker_agent)
+    for counter in counters.values():
+        counter.clear()
+    _worker_agent.usage.reset()
+    _worker_agent.metrics.reset()
+    if _worker_agent.reuse_index is not None:
+        _worker_agent.reuse_index.record_additions()
+
+    results = asyncio.run(_worker_agent.analyze_many_concurrent(items, **_worker_options))
+    return results, {
+        "usage": _worker_agent.usage.state(),
+        "metrics": _worker_agent.metrics.state(),
+        "counters": counters,
+        "reuse_entries": _worker_agent.reuse_index.added if _worker_agent.reuse_index is not None else None
+    }
+
+
+def analyze_sharded(agent, items, workers=None, **options):
+    """Score (post, comment) pairs across forked worker processes, results come back in input order
+
+    The encoder is loaded and warmed in this process before forking, so workers share its weights
+    copy-on-write instead of each holding their own copy. Each worker runs analyze_many_concurrent
+    on a contiguous shard with its own event loop, cores // workers threads and a 1/workers share
+    of the LLM limiter.
+    """
+    global _worker_agent, _worker_options
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("Sharded scoring shares the model through fork, which this platform doesn't support")
+
+    items = list(items)
+    workers = max(1, min(workers or physical_cores(), len(items)))
+    if workers == 1:
+        return asyncio.run(agent.analyze_many_concurrent(items, **options))
+
+    # Load and touch everything before forking so workers never load or allocate it themselves
+    agent.warmup()
+    agent.pretokenize(items)
+    _worker_agent = agent
+    _worker_options = options
+
+    shards = [[items[i] for i in shard] for shard in np.array_split(np.arange(len(items)), workers)]
+    num_threads = max(1, physical_cores() // workers)
+
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers, initializer=_init_worker, initargs=(num_threads, workers)) as pool:
+            outputs = pool.map(_score_shard, shards, chunksize=1)
+    finally:
+        _worker_agent = None
+        _worker_options = {}
+
+    # Token usage, metrics, every stats counter and new reuse index entries were filled in the workers
+    parent_counters = _counters(agent)
+    for _, state in outputs:
+        agent.usage.merge(state["usage"])
+        agent.metrics.merge(state["metrics"])
+        for name, counter in state["counters"].items():
+            parent_counters[name].update(counter)
+        if state["reuse_entries"]:
+            agent.reuse_index.add_many(*zip(*state["reuse_entries"]))
+
+    # Shards are contiguous, so concatenating keeps the input order
+    return [result for results, _ in outputs for result in results]
@@ -1,110 +1,233 @@
 from langchain_core.prompts import ChatPromptTemplate
 
-# A1 (Mood Agent)
-mood_prompt = ChatPromptTemplate.from_template("""
-Your job is to adjust the given sentiment score to be as accurate as possible.
+# Shared by every aspect prompt
+SCALE = """Your job is to adjust the given sentiment score to be as accurate as possible.
 The scale ranges from 0 to 100, where:
 - 0-30 = Negative sentiment
 - 31-69 = Neutral/mixed sentiment
-- 70-100 = Positive sentiment
+- 70-100 = Positive sentiment"""
 
-Focus ONLY on irrealis mood markers:
+OUTPUT_RULE = "Output must be exactly one integer between 0 and 100"
+
+# What each aspect agent looks at, and its aspect-specific rules
+ASPECTS = {
+    # A1 (Mood Agent)
+    "mood": {
+        "focus": """Focus ONLY on irrealis mood markers:
 ✓ Conditional language (would, could, should, might)
 ✓ Hypothetical statements
-✓ Speculative phrasing
+✓ Speculative phrasing""",
+        "rules": [
+            "Only adjust based on irrealis mood markers",
+            "If no relevant markers exist, return the original score"
+        ]
+    },
+    # A2 (Rhetoric Agent)
+    "rhetoric": {
+        "focus": """Focus ONLY on rhetorical devices:
+✓ Sarcasm/irony
+✓ Negative assertions
+✓ Rhetorical inversions
+✓ Hyperbole/understatement""",
+        "rules": [
+            "Only adjust based on rhetorical devices",
+            "If no relevant devices exist, return the original score"
+        ]
+    },
+    # A3 (Dependency Agent)
+    "dependency": {
+        "focus": """Focus ONLY on:
+✓ Author's direct sentiment (ignore quotes/references)
+✓ Original words only
+✓ Primary expression of opinion""",
+        "rules": [
+            "Ignore all third-party references",
+            "If no direct sentiment exists, return the original score"
+        ]
+    },
+    # A4 (Aspect Agent)
+    "aspect": {
+        "focus": """Focus ONLY on:
+✓ Primary entity/topic
+✓ Main subject only (ignore other mentions)
+✓ Core discussion point""",
+        "rules": [
+            "Ignore all off-topic sentiment",
+            "If no clear focus exists, return the original score"
+        ]
+    },
+    # A5 (Reference Agent)
+    "reference": {
+        "focus": """Focus ONLY on concrete references:
+✓ Price points/numbers
+✓ Time expressions
+✓ Quantitative comparisons
+✓ Factual benchmarks""",
+        "rules": [
+            "Weight numerical references heavily",
+            "If no concrete references exist, return the original score"
+        ]
+    }
+}
+
+
+def numbered(rules):
+    return "\n".join(f"{i}. {rule}" for i, rule in enumerate(rules, start=1))
+
 
-{input}
-Current Score: {score}
+def single_prompt(name, suffix=""):
+    """One post per request, the original prompt layout"""
+    aspect = ASPECTS[name]
+    return ChatPromptTemplate.from_template(f"""
+{SCALE}
+
+{aspect["focus"]}
+
+{{input}}
+Current Score: {{score}}
 
 Rules:
-1. Output must be exactly one integer between 0 and 100
-2. Only adjust based on irrealis mood markers
-3. If no relevant markers exist, return the original score
+{numbered([OUTPUT_RULE] + aspect["rules"])}{suffix}""")
 
-Adjusted Score:""")
 
-# A2 (Rhetoric Agent)
-rhetoric_prompt = ChatPromptTemplate.from_template("""
-Your job is to adjust the given sentiment score to be as accurate as possible.
-The scale ranges from 0 to 100, where:
-- 0-30 = Negative sentiment
-- 31-69 = Neutral/mixed sentiment
-- 70-100 = Positive sentiment
+def batch_prompt(name):
+    """K posts per request, answered as a JSON array keyed by item id"""
+    aspect = ASPECTS[name]
+    rules = [
+        'Output ONLY a JSON array with one entry per item: [{{"id": <item id>, "score": <integer 0-100>}}]',
+        "Score every item independently of the others"
+    ] + aspect["rules"]
+    return ChatPromptTemplate.from_template(f"""
+{SCALE}
 
-Focus ONLY on rhetorical devices:
-✓ Sarcasm/irony
-✓ Negative assertions
-✓ Rhetorical inversions
-✓ Hyperbole/understatement
+{aspect["focus"]}
+
+Each item below has its own text and current score.
 
-{input}
-Current Score: {score}
+{{items}}
 
 Rules:
-1. Output must be exactly one integer between 0 and 100
-2. Only adjust based on rhetorical devices
-3. If no relevant devices exist, return the original score""")
+{numbered(rules)}""")
 
-# A3 (Dependency Agent)
-dependency_prompt = ChatPromptTemplate.from_template("""
-Your job is to adjust the given sentiment score to be as accurate as possible.
-The scale ranges from 0 to 100, where:
-- 0-30 = Negative sentiment
-- 31-69 = Neutral/mixed sentiment
-- 70-100 = Positive sentiment
 
-Focus ONLY on:
-✓ Author's direct sentiment (ignore quotes/references)
-✓ Original words only
-✓ Primary expression of opinion
+def fused_prompt():
+    """All five aspects in one request, answered as one JSON object"""
+    aspects = aspect_guide()
+    example = ", ".join(f'"{name}": <integer 0-100>' for name in ASPECTS)
+    rules = [
+        f"Output ONLY a JSON object with one adjusted score per aspect: {{{{{example}}}}}",
+        "Judge each aspect separately, using only its own focus and rules"
+    ]
+    return ChatPromptTemplate.from_template(f"""
+{SCALE}
+
+Adjust the score from each of these aspects independently:
 
-{input}
-Current Score: {score}
+{aspects}
+
+{{input}}
+Current Score: {{score}}
 
 Rules:
-1. Output must be exactly one integer between 0 and 100
-2. Ignore all third-party references
-3. If no direct sentiment exists, return the original score""")
+{numbered(rules)}""")
 
-# A4 (Aspect Agent)
-aspect_prompt = ChatPromptTemplate.from_template("""
-Your job is to adjust the given sentiment score to be as accurate as possible.
-The scale ranges from 0 to 100, where:
-- 0-30 = Negative sentiment
-- 31-69 = Neutral/mixed sentiment
-- 70-100 = Positive sentiment
 
-Focus ONLY on:
-✓ Primary entity/topic
-✓ Main subject only (ignore other mentions)
-✓ Core discussion point
+def aspect_guide():
+    """Every aspect's focus and rules, in the order of ASPECTS"""
+    return "\n\n".join(
+        f"[{name}]\n{aspect['focus']}\n" + "\n".join(f"- {rule}" for rule in aspect["rules"])
+        for name, aspect in ASPECTS.items()
+    )
+
+
+# Identical for every aspect, every layout variant and every post, so provider-side prompt
+# caching can reuse it. Providers only cache prefixes past a minimum length (1024 tokens at
+# OpenAI); at about 360 tokens this one is below it, so anything static that gets added to
+# the prompts belongs in here.
+SHARED_PREFIX = f"""{SCALE}
+
+You adjust the score from one or more of these aspects, each with its own focus and rules:
+
+{aspect_guide()}"""
+
+
+def cached_prompt(tail):
+    """Static system prefix first, then the request-specific tail with the variables at the very end"""
+    return ChatPromptTemplate.from_messages([("system", SHARED_PREFIX), ("human", tail)])
 
-{input}
-Current Score: {score}
+
+def cached_single_prompt(name, suffix=""):
+    return cached_prompt(f"""Aspect: [{name}]
+Use only the [{name}] focus and rules.
 
 Rules:
-1. Output must be exactly one integer between 0 and 100
-2. Ignore all off-topic sentiment
-3. If no clear focus exists, return the original score""")
+{numbered([OUTPUT_RULE])}
 
-# A5 (Reference Agent)
-reference_prompt = ChatPromptTemplate.from_template("""
-Your job is to adjust the given sentiment score to be as accurate as possible.
-The scale ranges from 0 to 100, where:
-- 0-30 = Negative sentiment
-- 31-69 = Neutral/mixed sentiment
-- 70-100 = Positive sentiment
+{{input}}
+Current Score: {{score}}{suffix}""")
+
+
+def cached_batch_prompt(name):
+    rules = [
+        'Output ONLY a JSON array with one entry per item: [{{"id": <item id>, "score": <integer 0-100>}}]',
+        "Score every item independently of the others"
+    ]
+    return cached_prompt(f"""Aspect: [{name}]
+Use only the [{name}] focus and rules.
+
+Rules:
+{numbered(rules)}
+
+Each item below has its own text and current score.
+
+{{items}}""")
 
-Focus ONLY on concrete references:
-✓ Price points/numbers
-✓ Time expressions
-✓ Quantitative comparisons
-✓ Factual benchmarks
 
-{input}
-Current Score: {score}
+def cached_fused_prompt():
+    example = ", ".join(f'"{name}": <integer 0-100>' for name in ASPECTS)
+    rules = [
+        f"Output ONLY a JSON object with one adjusted score per aspect: {{{{{example}}}}}",
+        "Judge each aspect separately, using only its own focus and rules"
+    ]
+    return cached_prompt(f"""Adjust the score from each aspect independently.
 
 Rules:
-1. Output must be exactly one integer between 0 and 100
-2. Weight numerical references heavily
-3. If no concrete references exist, return the original score""")
\ No newline at end of file
+{numbered(rules)}
+
+{{input}}
+Current Score: {{score}}""")
+
+
+mood_prompt = single_prompt("mood", suffix="\n\nAdjusted Score:")
+rhetoric_prompt = single_prompt("rhetoric")
+dependency_prompt = single_prompt("dependency")
+aspect_prompt = single_prompt("aspect")
+reference_prompt = single_prompt("reference")
+
+batch_prompts = {name: batch_prompt(name) for name in ASPECTS}
+all_aspects_prompt = fused_prompt()
+
+
+# "classic" keeps the original layout, "cached" moves everything static into SHARED_PREFIX
+PROMPT_LAYOUTS = {
+    "classic": {
+        "single": {
+            "aspect": aspect_prompt,
+            "mood": mood_prompt,
+            "rhetoric": rhetoric_prompt,
+            "reference": reference_prompt,
+            "dependency": dependency_prompt
+        },
+        "batch": batch_prompts,
+        "fused": all_aspects_prompt
+    },
+    "cached": {
+        "single": {
+            # Same trailing cue as the classic mood prompt
+            name: cached_single_prompt(name, suffix="\n\nAdjusted Score:" if name == "mood" else "")
+            for name in ("aspect", "mood", "rhetoric", "reference", "dependency")
+        },
+        "batch": {name: cached_batch_prompt(name) for name in ASPECTS},
+        "fused": cached_fused_prompt()
+    }
+}
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from collections import Counter
+
+
+def is_rate_limit_error(error):
+    """429s from the OpenAI client (or anything else that looks like one)"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "RateLimit" in type(error).__name__
+
+
+def is_timeout_error(error):
+    return isinstance(error, asyncio.TimeoutError) or "Timeout" in type(error).__name__
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, take() waits until enough budget has built up"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available_now(self, amount=1):
+        self.refill()
+        return self.available >= min(amount, self.capacity)
+
+    def try_take(self, amount=1):
+        """Take the budget only if it is there right now, never waits"""
+        if not self.available_now(amount):
+            return False
+        self.available -= min(amount, self.capacity)
+        return True
+
+    async def take(self, amount=1):
+        # A single request bigger than the bucket would wait forever, let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        self.refill()
+        while self.available < amount:
+            await asyncio.sleep((amount - self.available) / self.rate)
+            self.refill()
+        self.available -= amount
+
+
+class AdaptiveLimiter:
+    """Agent-wide cap on in-flight LLM requests with AIMD concurrency and optional rpm/tpm buckets
+
+    Concurrency grows by roughly one slot per window of successful requests and halves on a
+    rate-limit error, a timeout, or latency well above the best latency seen so far. A small
+    separate pool of hedge slots lets duplicates of slow requests skip the queue, since a hedge
+    that waits behind other work can't cut anyone's latency.
+    """
+
+    MAX_CONCURRENCY = 16
+    MIN_CONCURRENCY = 1
+    DECREASE_FACTOR = 0.5
+    DECREASE_COOLDOWN = 2.0  # seconds, one burst of 429s only halves the limit once
+    LATENCY_BACKOFF = 3.0    # back off when latency exceeds this multiple of the best average
+    LATENCY_SMOOTHING = 0.2
+    HEDGE_SLOT_SHARE = 8     # One hedge slot per this many regular slots, at least one
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, min_concurrency=MIN_CONCURRENCY,
+                 requests_per_minute=None, tokens_per_minute=None, hedge_slots=None):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self.hedge_slots = hedge_slots if hedge_slots is not None else max(1, max_concurrency // self.HEDGE_SLOT_SHARE)
+        self.hedges_active = 0
+
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+        self.latency = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.stats = Counter()
+
+        self._loop = None
+        self._waiters = []
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Nothing can still be in flight on a loop that asyncio.run already closed
+            self._loop = loop
+            self._waiters = []
+            self.active = 0
+            self.hedges_active = 0
+        return loop
+
+    async def acquire(self, tokens=0):
+        loop = self._check_loop()
+        while self.active >= int(self.limit):
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.active += 1
+
+        try:
+            if self.request_bucket:
+                await self.request_bucket.take(1)
+            if self.token_bucket and tokens:
+                await self.token_bucket.take(tokens)
+        except BaseException:
+            self.active -= 1
+            self._wake()
+            raise
+
+    def can_hedge(self, tokens=0):
+        """Whether a hedge slot and the rpm/tpm budget for one more request are free right now"""
+        self._check_loop()
+        if self.hedges_active >= self.hedge_slots:
+            return False
+        if self.request_bucket and not self.request_bucket.available_now(1):
+            return False
+        return not (self.token_bucket and tokens and not self.token_bucket.available_now(tokens))
+
+    def try_acquire_hedge(self, tokens=0):
+        """Take a hedge slot without waiting, False when none is free"""
+        if not self.can_hedge(tokens):
+            return False
+        if self.request_bucket:
+            self.request_bucket.try_take(1)
+        if self.token_bucket and tokens:
+            self.token_bucket.try_take(tokens)
+        self.hedges_active += 1
+        return True
+
+    def release(self, latency=None, error=None, hedge=False):
+        if hedge:
+            self.hedges_active -= 1
+        else:
+            self.active -= 1
+        if isinstance(error, asyncio.CancelledError):
+            pass  # Cancelled by the caller, says nothing about the provider
+        elif error is not None and (is_rate_limit_error(error) or is_timeout_error(error)):
+            self.stats["rate_limited" if is_rate_limit_error(error) else "timeouts"] += 1
+            self.decrease()
+        elif error is not None:
+            self.stats["errors"] += 1
+        else:
+            self.stats["successes"] += 1
+            self.observe_latency(latency)
+        self._wake()
+
+    def observe_latency(self, latency):
+        if latency is None:
+            self.increase()
+            return
+
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+        self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+
+        if self.latency > self.best_latency * self.LATENCY_BACKOFF:
+            self.stats["slowdowns"] += 1
+            self.decrease()
+        else:
+            self.increase()
+
+    def increase(self):
+        """Additive increase, about one extra slot per limit-sized window of successes"""
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def decrease(self):
+        """Multiplicative decrease, at most once per cooldown"""
+        now = time.monotonic()
+        if now - self.last_decrease < self.DECREASE_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * self.DECREASE_FACTOR)
+        self.stats["decreases"] += 1
+
+    def split(self, parts):
+        """Keep only a 1/parts share of the budget, for one of several worker processes"""
+        self.max_concurrency = max(self.min_concurrency, self.max_concurrency // parts)
+        self.limit = min(self.limit, self.max_concurrency)
+        self.hedge_slots = max(1, self.hedge_slots // parts)
+        for bucket in (self.request_bucket, self.token_bucket):
+            if bucket:
+                bucket.rate /= parts
+                bucket.capacity /= parts
+                bucket.available = min(bucket.available, bucket.capacity)
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
@@ -0,0 +1,83 @@
+import logging
+import re
+from collections import Counter
+import numpy as np
+
+FAST = "fast"
+REASONING = "reasoning"
+
+# Cheap lexical hints that a post needs a model that can read between the lines
+SARCASM_MARKERS = (
+    r"/s\b", r"\byeah right\b", r"\bsure\b", r"\btotally\b", r"\bobviously\b", r"\bclearly\b",
+    r"\bwhat could go wrong\b", r"\bgreat job\b", r"\bthanks a lot\b", r"\blol\b", r"\blmao\b",
+    r"🙄", r"😂", r"🤡", r"🤣", r"!{2,}", r"\?!"
+)
+HEDGING_MARKERS = (
+    r"\bmaybe\b", r"\bmight\b", r"\bcould\b", r"\bwould\b", r"\bshould\b", r"\bprobably\b", r"\bperhaps\b",
+    r"\bi think\b", r"\bi guess\b", r"\bnot sure\b", r"\bidk\b", r"\bif\b", r"\bunless\b", r"\bseems\b", r"\bbut\b"
+)
+
+
+def compile_markers(markers):
+    return re.compile("|".join(markers), re.IGNORECASE)
+
+
+class Router:
+    """Picks a model tier per post from its length, the encoder's entropy and sarcasm/hedging markers
+
+    A post goes to the fast tier only when it is short, the encoder is fairly sure about it and
+    nothing in it suggests sarcasm or hedging; everything else goes to the reasoning tier.
+    """
+
+    MAX_EASY_WORDS = 40
+    MAX_EASY_ENTROPY = 0.8  # nats, max ln 3 ~ 1.10
+
+    def __init__(self, max_easy_words=MAX_EASY_WORDS, max_easy_entropy=MAX_EASY_ENTROPY,
+                 sarcasm_markers=SARCASM_MARKERS, hedging_markers=HEDGING_MARKERS):
+        self.max_easy_words = max_easy_words
+        self.max_easy_entropy = max_easy_entropy
+        self.sarcasm = compile_markers(sarcasm_markers)
+        self.hedging = compile_markers(hedging_markers)
+        self.stats = Counter()
+
+    def features(self, text, probabilities):
+        return {
+            "words": len(text.split()),
+            "entropy": float(-np.sum(probabilities * np.log(np.clip(probabilities, 1e-12, 1.0)))),
+            "sarcasm": bool(self.sarcasm.search(text)),
+            "hedging": bool(self.hedging.search(text))
+        }
+
+    def reasons(self, features):
+        """Why a post counts as hard, empty for easy posts"""
+        reasons = []
+        if features["words"] > self.max_easy_words:
+            reasons.append("long")
+        if features["entropy"] > self.max_easy_entropy:
+            reasons.append("uncertain")
+        if features["sarcasm"]:
+            reasons.append("sarcasm")
+        if features["hedging"]:
+            reasons.append("hedging")
+        return reasons
+
+    def route(self, text, probabilities):
+        """(tier, reasons) for one post"""
+        features = self.features(text, probabilities)
+        reasons = self.reasons(features)
+        tier = REASONING if reasons else FAST
+
+        self.stats[tier] += 1
+        self.stats.update(f"reason.{reason}" for reason in reasons)
+        logging.info(f"Routed to {tier} ({', '.join(reasons) or 'easy'}): {features} {text[:60]!r}")
+        return tier, reasons
+
+    def report(self):
+        routed = self.stats[FAST] + self.stats[REASONING]
+        return {
+            "routed": routed,
+            "fast": self.stats[FAST],
+            "reasoning": self.stats[REASONING],
+            "fast_share": round(self.stats[FAST] / routed, 4) if routed else 0.0,
+            "reasons": {key.split(".", 1)[1]: count for key, count in sorted(self.stats.items()) if "." in key}
+        }
@@ -1,34 +1,329 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
 import pandas as pd
 from sentiment_agent import SentimentAgent
+from parallel import analyze_sharded
+from dedup import Deduplicator
+from windows import REDUCERS
+from hedging import Hedger
 
-def run_sentiment_analysis(input_csv, output_csv):
-    df = pd.read_csv(input_csv)
+CHUNK_SIZE = 100
+CONCURRENCY = 16
 
+def check_columns(df):
     if 'Submission' not in df.columns or 'Sentiment Score' not in df.columns:
         raise ValueError("CSV must contain 'post' and 'manual_sentiment_score' columns")
 
-    agent = SentimentAgent()
+def row_comment(df, row):
+    return row['Comment'] if 'Comment' in df.columns and pd.notna(row['Comment']) else None
+
+def report_run(agent, rows):
+    """Print LLM usage, cost, model routing and hedging, save the embedding reuse index and print how much it saved"""
+    print(f"LLM usage: {json.dumps(agent.usage.summary(posts=rows))}")
+    if agent.router is not None:
+        print(f"Model routing: {json.dumps(agent.router.report())}")
+    if agent.hedger is not None:
+        print(f"Hedged requests: {json.dumps(agent.hedger.report())}")
+    if agent.reuse_index is not None:
+        agent.save_reuse_index()
+        print(f"Embedding reuse: {agent.reuse_index.report()}")
+
+def run_sentiment_analysis(input_csv, output_csv, agent=None):
+    df = pd.read_csv(input_csv)
+
+    check_columns(df)
+
+    agent = agent or SentimentAgent()
+    agent.warmup()
 
     predicted_scores = []
+    cycles_used = []
 
     for _, row in df.iterrows():
         post = row['Submission']
-        comment = row['Comment'] if 'Comment' in df.columns and pd.notna(row['Comment']) else None
+        comment = row_comment(df, row)
 
         try:
-            if comment:
-                score = agent.run(post, comment)
-            else:
-                score = agent.run(post)
+            result = agent.analyze(post, comment)
+            score, cycles = result.score, result.cycles
         except Exception as e:
             print(f"Error processing post: {post[:30]}... => {e}")
-            score = None
+            score, cycles = None, None
 
         predicted_scores.append(score)
+        cycles_used.append(cycles)
 
     df['predicted_sentiment_score'] = predicted_scores
+    df['cycles_used'] = cycles_used
     df.to_csv(output_csv, index=False)
+    report_run(agent, len(df))
+    print(f"Finished writing to {output_csv}")
+
+def run_sentiment_analysis_sharded(input_csv, output_csv, workers=None, agent=None, dedupe=False,
+                                   near_duplicates=False):
+    """Score the whole CSV across forked worker processes sharing one loaded model
+
+    With dedupe, only one representative per (near-)duplicate cluster is scored and its result
+    is copied to the rest of the cluster.
+    """
+    df = pd.read_csv(input_csv)
+
+    check_columns(df)
+
+    agent = agent or SentimentAgent()
+    items = [(row['Submission'], row_comment(df, row)) for _, row in df.iterrows()]
+
+    deduplicator = Deduplicator(near_duplicates=near_duplicates) if dedupe or near_duplicates else None
+    if deduplicator:
+        representatives = deduplicator.collapse([agent.format_input(post, comment) for post, comment in items])
+        items = [items[i] for i in representatives]
+
+    start = time.perf_counter()
+    results = analyze_sharded(agent, items, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    if deduplicator:
+        results = deduplicator.expand(results)
+        print(f"Deduplication: {deduplicator.report()}")
+
+    df['predicted_sentiment_score'] = [result.score for result in results]
+    df['cycles_used'] = [result.cycles for result in results]
+    df.to_csv(output_csv, index=False)
+    report_run(agent, len(items))
+    print(f"Scored {len(df)} rows in {elapsed:.1f}s ({len(df) / elapsed:.2f} rows/s)")
+    print(f"Finished writing to {output_csv}")
+
+class Progress:
+    """Single live status line on stderr"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+
+    def update(self, failed=False):
+        self.done += 1
+        self.failed += failed
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        sys.stderr.write(f"\r{self.done} rows  {rate:.2f} rows/s  {self.failed} failed  {elapsed:.0f}s")
+        sys.stderr.flush()
+
+    def finish(self):
+        sys.stderr.write("\n")
+
+class Checkpoint:
+    """Append-only sidecar of finished rows keyed by a hash of the row's text, so reruns can resume
+
+    The first line records the agent's config fingerprint. A checkpoint written by an agent with
+    other settings (model, prompts, cycles, refinement, gate...) is discarded instead of resumed.
+    """
+
+    def __init__(self, path, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.done = {}
+        self.stale = False
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                try:
+                    header = json.loads(f.readline())
+                except ValueError:
+                    header = {}
+                self.stale = not isinstance(header, dict) or header.get('fingerprint') != fingerprint
+                if not self.stale:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self.done[entry['key']] = (entry['score'], entry['cycles'])
+                        except (ValueError, KeyError):
+                            continue  # Half-written last line from a crash
+
+        if self.done:
+            self.file = open(path, 'a', encoding='utf-8')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+            self.file.write(json.dumps({'fingerprint': fingerprint}) + "\n")
+            self.file.flush()
+
+    @staticmethod
+    def row_key(post, comment):
+        return hashlib.sha256(json.dumps([post, comment]).encode('utf-8')).hexdigest()
+
+    def record(self, key, score, cycles):
+        self.done[key] = (score, cycles)
+        self.file.write(json.dumps({'key': key, 'score': score, 'cycles': cycles}) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        """Drop the checkpoint once the output it protects is complete"""
+        self.close()
+        os.remove(self.path)
+
+async def score_row(agent, index, df, row, checkpoint=None):
+    post = row['Submission']
+    comment = row_comment(df, row)
+
+    key = Checkpoint.row_key(post, comment) if checkpoint else None
+    if checkpoint and key in checkpoint.done:
+        return (index, row) + checkpoint.done[key]
+
+    try:
+        result = await agent.analyze_concurrent(post, comment)
+        if checkpoint:
+            checkpoint.record(key, result.score, result.cycles)
+        return index, row, result.score, result.cycles
+    except Exception as e:
+        print(f"\nError processing post: {post[:30]}... => {e}")
+        return index, row, None, None
+
+async def run_sentiment_analysis_streaming(input_csv, output_csv, chunksize=CHUNK_SIZE, concurrency=CONCURRENCY,
+                                           ordered=True, agent=None, checkpoint=True):
+    """Score the CSV chunk by chunk on one event loop, writing rows out as they finish
+
+    At most `concurrency` rows are in flight at once. With ordered=False rows are written in
+    completion order and tagged with their input row index instead. Finished rows are also
+    appended to <output_csv>.checkpoint.jsonl; a rerun with the same agent settings only scores
+    rows missing from it. The checkpoint is removed once every row has a score.
+    """
+    agent = agent or SentimentAgent()
+    agent.warmup()
+
+    checkpoint = Checkpoint(output_csv + ".checkpoint.jsonl", agent.config_fingerprint()) if checkpoint else None
+    if checkpoint and checkpoint.stale:
+        print(f"Ignoring {checkpoint.path}, it was written with different agent settings")
+    if checkpoint and checkpoint.done:
+        print(f"Resuming, {len(checkpoint.done)} rows already scored in {checkpoint.path}")
+
+    progress = Progress()
+    pending = set()
+    finished_rows = {}
+    next_row = 0
+
+    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        columns = None
+
+        def write(index, row, score, cycles):
+            values = [row[column] if pd.notna(row[column]) else "" for column in columns]
+            writer.writerow(([index] if not ordered else []) + values + [score, cycles])
+
+        def collect(tasks):
+            nonlocal next_row
+            for task in tasks:
+                index, row, score, cycles = task.result()
+                progress.update(failed=score is None)
+                if ordered:
+                    finished_rows[index] = (row, score, cycles)
+                else:
+                    write(index, row, score, cycles)
+
+            # Only write out an unbroken run of rows so the output keeps input order
+            while next_row in finished_rows:
+                write(next_row, *finished_rows.pop(next_row))
+                next_row += 1
+            f.flush()
+
+        for chunk in pd.read_csv(input_csv, chunksize=chunksize):
+            if columns is None:
+                check_columns(chunk)
+                columns = list(chunk.columns)
+                writer.writerow((['row'] if not ordered else []) + columns + ['predicted_sentiment_score', 'cycles_used'])
+
+            for index, row in chunk.iterrows():
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                pending.add(asyncio.create_task(score_row(agent, index, chunk, row, checkpoint)))
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            collect(done)
+
+    progress.finish()
+    # A complete output CSV means a later run must score from scratch rather than resume. Failed
+    # rows were never recorded, so keep the checkpoint and a rerun scores only those
+    if checkpoint and progress.failed:
+        checkpoint.close()
+        print(f"{progress.failed} rows failed, rerun with the same settings to score only those ({checkpoint.path})")
+    elif checkpoint:
+        checkpoint.remove()
+    report_run(agent, progress.done)
     print(f"Finished writing to {output_csv}")
 
 if __name__ == "__main__":
-    run_sentiment_analysis("tests/output_sentiment.csv", "tests/agent_results.csv")
+    parser = argparse.ArgumentParser(description="Score a labelled CSV with SentimentAgent")
+    parser.add_argument("input_csv", nargs="?", default="tests/output_sentiment.csv")
+    parser.add_argument("output_csv", nargs="?", default="tests/agent_results.csv")
+    parser.add_argument("--sequential", action="store_true", help="old one-row-at-a-time mode")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="rows scored at once")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="rows read from the CSV at a time")
+    parser.add_argument("--unordered", action="store_true", help="write rows as they finish, tagged with their index")
+    parser.add_argument("--workers", type=int, help="score in this many forked processes instead of streaming")
+    parser.add_argument("--dedupe", action="store_true", help="score exact duplicates once (bulk mode)")
+    parser.add_argument("--near-duplicates", action="store_true", help="also cluster near duplicates with SimHash")
+    parser.add_argument("--no-checkpoint", action="store_true", help="don't resume from or write a checkpoint file")
+    parser.add_argument("--token-cache", metavar="DIR", help="read pre-tokenized texts from a memory-mapped cache in DIR")
+    parser.add_argument("--long-text", choices=sorted(REDUCERS),
+                        help="score long inputs as overlapping windows combined with this reducer instead of truncating")
+    parser.add_argument("--reuse-threshold", type=float,
+                        help="reuse the refined score of an earlier post at least this cosine-similar")
+    parser.add_argument("--reuse-index", metavar="PATH", help="load and save the embedding reuse index here (.npz)")
+    parser.add_argument("--prompt-layout", choices=["classic", "cached"], default="classic",
+                        help="'cached' puts all static instructions in a shared prefix for provider prompt caching")
+    parser.add_argument("--fast-model", metavar="MODEL",
+                        help="refine short, confident, plain posts with this cheaper model, the rest with the default")
+    parser.add_argument("--hedge", type=float, nargs="?", const=Hedger.MAX_RATIO, metavar="BUDGET",
+                        help="duplicate LLM requests slower than the recent p95, at most BUDGET hedges per request")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="dump stage timings and LLM counters here at the end (.prom for Prometheus, else JSON)")
+    parser.add_argument("--distilled-head", metavar="PATH",
+                        help="score with a head trained by distill.py instead of the LLM chains")
+    args = parser.parse_args()
+
+    agent = SentimentAgent(
+        token_cache_dir=args.token_cache,
+        long_text=args.long_text,
+        reuse_threshold=args.reuse_threshold,
+        reuse_index_path=args.reuse_index,
+        refinement="distilled" if args.distilled_head else "chains",
+        distilled_head=args.distilled_head,
+        prompt_layout=args.prompt_layout,
+        fast_model_name=args.fast_model,
+        hedger=Hedger(max_ratio=args.hedge) if args.hedge else None
+    )
+
+    if args.sequential:
+        run_sentiment_analysis(args.input_csv, args.output_csv, agent=agent)
+    elif args.workers or args.dedupe or args.near_duplicates:
+        run_sentiment_analysis_sharded(
+            args.input_csv,
+            args.output_csv,
+            workers=args.workers or 1,
+            agent=agent,
+            dedupe=args.dedupe,
+            near_duplicates=args.near_duplicates
+        )
+    else:
+        asyncio.run(run_sentiment_analysis_streaming(
+            args.input_csv,
+            args.output_csv,
+            chunksize=args.chunksize,
+            concurrency=args.concurrency,
+            ordered=not args.unordered,
+            agent=agent,
+            checkpoint=not args.no_checkpoint
+        ))
+
+    if args.metrics:
+        agent.metrics.write(args.metrics)
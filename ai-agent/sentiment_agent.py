@@ -1,112 +1,887 @@
-from transformers import AutoTokenizer
-from transformers import AutoModelForSequenceClassification
-from scipy.special import softmax
 from langchain_openai import ChatOpenAI
-from prompts import mood_prompt, aspect_prompt, rhetoric_prompt, reference_prompt, dependency_prompt
-import torch
+from prompts import PROMPT_LAYOUTS
+from batching import BatchCoalescer
+from llm_cache import ResponseCache, prompt_fingerprint
+from rate_limit import AdaptiveLimiter, is_rate_limit_error, is_timeout_error
+from token_cache import TokenCache
+from encoders import BACKENDS, Encoder, get_encoder, parity_report
+from windows import REDUCERS, split_windows, weighted_mean
+from similarity import EmbeddingIndex
+from distill import DistilledHead, features
+from metrics import Metrics
+from usage import Scope, UsageTracker, current_scope, usage_from
+from routing import FAST, REASONING, Router
+from hedging import NoHedgeSlot
+import numpy as np
 import logging
+import hashlib
+import json
 import os
 import re
+import time
 import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+
+
+@dataclass
+class SentimentResult:
+    """Final score for one post plus how it was reached"""
+    score: float
+    base_score: float
+    cycles: int = 0
+    gated: bool = False  # True when the encoder was confident enough to skip refinement
+    reused: bool = False  # True when a near-identical post's refined score was reused
+    usage: Counter = field(default_factory=Counter)  # LLM tokens and cost_usd spent on this post
+    tier: str = None  # Model tier the refinement ran on, None when it never reached the LLM
+
+
+@dataclass
+class Tier:
+    """One refinement model and the chains built on it"""
+    model_name: str
+    llm: object
+    chains: dict
+    batch_chains: dict
+    fused_chain: object
+
+
+def valid_score(score):
+    """Scores live on the 0-100 scale, anything else is a misread and must not be cached"""
+    return 0 <= score <= 100
+
+
+def parse_score(response_text):
+    """First number in a single-chain response, None when there is none or it is off the scale"""
+    numbers = re.findall(r"\b\d{1,3}(?:\.\d+)?\b", response_text)
+    if not numbers or not valid_score(float(numbers[0])):
+        return None
+    return float(numbers[0])
+
+
+def parse_item_scores(response_text):
+    """Pull {item id: score} out of the JSON array (or object) in a batched chain response"""
+    match = re.search(r"\[.*\]|\{.*\}", response_text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    
+    if isinstance(data, dict):
+        pairs = data.items()
+    else:
+        pairs = [(entry.get("id"), entry.get("score")) for entry in data if isinstance(entry, dict)]
+    
+    scores = {}
+    for item_id, score in pairs:
+        try:
+            item_id, score = int(item_id), float(score)
+        except (TypeError, ValueError):
+            continue
+        if valid_score(score):
+            scores[item_id] = score
+    return scores
+
+
+def parse_aspect_scores(response_text, names):
+    """Pull {aspect name: score} out of the JSON object in a fused chain response"""
+    match = re.search(r"\{.*\}", response_text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    scores = {}
+    for name in names:
+        try:
+            score = float(data[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if valid_score(score):
+            scores[name] = score
+    return scores
+
 
 class SentimentAgent:
     
     MODEL = "cardiffnlp/twitter-roberta-base-sentiment"
+    CHAIN_NAMES = ("aspect", "mood", "rhetoric", "reference", "dependency")
     CYCLES = 3
+    CONVERGENCE_EPSILON = 1.0  # Stop once the averaged score moves less than this between cycles
+    CONVERGENCE_SPREAD = 5.0   # ...or once all chain outputs sit within this range of each other
+    BATCH_SIZE = 32
+    BATCH_WAIT_MS = 10
+    REFINE_BATCH_SIZE = 8  # Posts per chain request in analyze_many
+    WINDOW_STRIDE = 128    # Tokens shared by consecutive windows in long-text mode
+    # Five separate chains, one request for all five aspects, or a head trained on agent scores (no LLM)
+    REFINEMENT_MODES = ("chains", "fused", "distilled")
+    LLM_RETRIES = 3                 # Retries on 429s and timeouts, the limiter backs off in between
+    RETRY_BACKOFF = 1.0             # seconds, doubled on every retry
+    ESTIMATED_OVERHEAD_TOKENS = 800  # Prompt preamble plus (reasoning) completion, for the tokens/min bucket
+    # Default thresholds for the confidence gate, a post skips refinement when it clears them
+    GATE_THRESHOLDS = {
+        "max_prob": 0.90,  # top label probability at least this
+        "entropy": 0.35,   # entropy (nats, max ln 3 ~ 1.10) at most this
+        "margin": 0.60     # top-1 minus top-2 probability at least this
+    }
     
-    def __init__(self, openai_api_key=None, model_name="o4-mini-2025-04-16", nlp_model=MODEL):
+    def __init__(self, openai_api_key=None, model_name="o4-mini-2025-04-16", nlp_model=MODEL,
+                 max_batch_size=BATCH_SIZE, max_batch_wait_ms=BATCH_WAIT_MS, backend="auto", num_threads=None, device=None,
+                 cycles=CYCLES, convergence_epsilon=CONVERGENCE_EPSILON, convergence_spread=CONVERGENCE_SPREAD,
+                 gate=None, gate_threshold=None, cache_path=None, cache_max_entries=ResponseCache.MAX_ENTRIES,
+                 cache_score_step=ResponseCache.SCORE_STEP, refinement="chains",
+                 max_llm_concurrency=AdaptiveLimiter.MAX_CONCURRENCY, requests_per_minute=None, tokens_per_minute=None,
+                 llm=None, openai_base_url=None, token_cache_dir=None, long_text=None, window_stride=WINDOW_STRIDE,
+                 reuse_threshold=None, reuse_max_entries=EmbeddingIndex.MAX_ENTRIES, reuse_index_path=None,
+                 distilled_head=None, metrics=None, pricing=None, prompt_layout="classic",
+                 fast_model_name=None, fast_llm=None, router=None, hedger=None):
         logging.basicConfig(level=logging.ERROR)
         
-        # Set OpenAI API key
+        # Set OpenAI API key, not needed when a ready-made chat model (e.g. fake_llm.FakeChatModel) is passed in
+        # or when scoring with the distilled head only
         if openai_api_key:
             os.environ["OPENAI_API_KEY"] = openai_api_key
-        elif "OPENAI_API_KEY" not in os.environ:
+        elif "OPENAI_API_KEY" not in os.environ and llm is None and refinement != "distilled":
             raise ValueError("OpenAI API key must be provided either as argument or through environment variable")
         
+        # Stage timings and LLM retry/failure counts, see metrics.Metrics for hooks and dumps
+        self.metrics = metrics or Metrics()
+        
+        # Tokens and estimated cost from every response's usage metadata, pricing overrides usage.PRICING
+        self.usage = UsageTracker(pricing)
+        
+        # Refinement loop limits, pass None to disable either early exit
+        self.cycles = cycles
+        self.convergence_epsilon = convergence_epsilon
+        self.convergence_spread = convergence_spread
+        
+        # Confidence gate on the encoder output, None sends every post through refinement
+        if gate is not None and gate not in self.GATE_THRESHOLDS:
+            raise ValueError(f"Unknown gate '{gate}', expected one of {sorted(self.GATE_THRESHOLDS)}")
+        self.gate = gate
+        self.gate_threshold = gate_threshold if gate_threshold is not None else self.GATE_THRESHOLDS.get(gate)
+        self.gate_stats = Counter()
+        
+        # Long-text mode: score overlapping windows and combine them instead of truncating at 512 tokens
+        if long_text is not None and long_text not in REDUCERS:
+            raise ValueError(f"Unknown long_text reducer '{long_text}', expected one of {sorted(REDUCERS)}")
+        self.long_text = long_text
+        self.window_stride = window_stride
+        
+        self.reuse_index = None
+        
         try:
-            # Initialize tokenizer and model
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                nlp_model,
-                truncation=True,
-                max_length=514
+            # Tokenizer and model for the selected backend (fp32, fp16, int8, onnx), loaded once per process
+            self.nlp_model = nlp_model
+            self.encoder = get_encoder(backend, nlp_model, num_threads=num_threads, device=device)
+            self.tokenizer = self.encoder.tokenizer
+            
+            # Optional memory-mapped store of pre-tokenized texts, takes tokenizing off the hot path
+            self.token_cache = TokenCache(self.tokenizer, token_cache_dir, self.encoder.tokenizer_lock) if token_cache_dir else None
+            
+            # Coalesce concurrent run_concurrent calls into shared forward passes
+            self.batcher = BatchCoalescer(
+                self.encoder_rows,
+                self.token_ids,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_batch_wait_ms
             )
             
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                nlp_model,
-                device_map="auto",
-                torch_dtype=torch.float16
+            # Initialize LLM, retries happen in call_llm so the limiter sees every 429
+            # Without an API key there is none, and only the distilled mode can score
+            self.model_name = model_name
+            self.llm = llm
+            if self.llm is None and "OPENAI_API_KEY" in os.environ:
+                self.llm = ChatOpenAI(
+                    model_name=model_name,
+                    temperature=1,
+                    request_timeout=60.0,
+                    max_retries=0,
+                    base_url=openai_base_url
+                )
+            
+            # Every LLM request made by this agent shares one adaptive limiter
+            self.limiter = AdaptiveLimiter(
+                max_concurrency=max_llm_concurrency,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute
             )
+            self.llm_stats = Counter()
+            
+            # Optional duplicate requests for stragglers, see hedging.Hedger for the delay and budget
+            self.hedger = hedger
+            if self.hedger is not None and self.hedger.metrics is None:
+                self.hedger.metrics = self.metrics
+            
+            # Initialize chains, the "cached" layout shares one static prefix for provider prompt caching
+            if prompt_layout not in PROMPT_LAYOUTS:
+                raise ValueError(f"Unknown prompt layout '{prompt_layout}', expected one of {sorted(PROMPT_LAYOUTS)}")
+            self.prompt_layout = prompt_layout
+            prompts = PROMPT_LAYOUTS[prompt_layout]
+            self.chains = {}
+            self.batch_chains = {}
+            self.fused_chain = None
+            self.tiers = {}
+            if self.llm is not None:
+                self.tiers[REASONING] = self.build_tier(model_name, self.llm, prompts)
+                self.chains = self.tiers[REASONING].chains
+                self.batch_chains = self.tiers[REASONING].batch_chains
+                self.fused_chain = self.tiers[REASONING].fused_chain
+                self.aspect_chain, self.mood_chain, self.rhetoric_chain, self.reference_chain, self.dependency_chain = (
+                    self.chains[name] for name in self.CHAIN_NAMES
+                )
+            
+            # Optional cheaper tier for easy posts, the router picks a tier per post from cheap features
+            self.router = None
+            if fast_model_name or fast_llm:
+                if self.llm is None:
+                    raise ValueError("Tiered routing needs the reasoning-tier LLM as well")
+                # The tiers' model names key the response cache and the usage, they must differ
+                fast_model_name = fast_model_name or getattr(fast_llm, "model_name", None)
+                if not fast_model_name:
+                    raise ValueError("Pass fast_model_name for a fast_llm that doesn't name its model")
+                if fast_model_name == model_name:
+                    raise ValueError(f"The fast tier must use another model than the reasoning tier ({model_name})")
+                fast_llm = fast_llm or ChatOpenAI(
+                    model_name=fast_model_name,
+                    temperature=1,
+                    request_timeout=60.0,
+                    max_retries=0,
+                    base_url=openai_base_url
+                )
+                self.tiers[FAST] = self.build_tier(fast_model_name, fast_llm, prompts)
+                self.router = router or Router()
             
-            # Initialize LLM
-            self.llm = ChatOpenAI(
-                model_name=model_name,
-                temperature=1,
-                request_timeout=60.0
+            # Optional on-disk cache of chain responses, keyed on the prompts so edits invalidate it
+            self.prompt_fingerprint = prompt_fingerprint(
+                [prompts["single"][name] for name in self.CHAIN_NAMES]
+                + [prompts["batch"][name] for name in self.CHAIN_NAMES]
+                + [prompts["fused"]]
             )
+            self.cache = None
+            if cache_path:
+                self.cache = ResponseCache(
+                    cache_path,
+                    namespace=self.prompt_fingerprint,
+                    max_entries=cache_max_entries,
+                    score_step=cache_score_step
+                )
             
-            # Initialize chains
-            self.aspect_chain = aspect_prompt | self.llm
-            self.mood_chain = mood_prompt | self.llm
-            self.rhetoric_chain = rhetoric_prompt | self.llm
-            self.reference_chain = reference_prompt | self.llm
-            self.dependency_chain = dependency_prompt | self.llm
+            # Regression head trained by distill.py on agent-refined scores, replaces the LLM in "distilled" mode
+            self.distilled = DistilledHead.load(distilled_head) if distilled_head else None
+            if self.distilled is not None and self.distilled.namespace != nlp_model:
+                raise ValueError(f"Distilled head was trained on {self.distilled.namespace}, not {nlp_model}")
+            
+            self.refinement = self.check_refinement(refinement)
+            
+            # Optional reuse of refined scores for posts whose embedding is within reuse_threshold cosine,
+            # a persisted index only serves runs whose settings would have produced the same scores
+            if reuse_threshold is not None:
+                self.reuse_index = EmbeddingIndex(
+                    threshold=reuse_threshold,
+                    max_entries=reuse_max_entries,
+                    path=reuse_index_path,
+                    namespace=self.config_fingerprint(reuse=False)
+                )
 
         except Exception as e:
             logging.error(f"Initialization Error: {e}")
             raise
     
-    async def run_chain(self, chain, input_text, score):
+    def build_tier(self, model_name, llm, prompts):
+        return Tier(
+            model_name=model_name,
+            llm=llm,
+            chains={name: prompts["single"][name] | llm for name in self.CHAIN_NAMES},
+            batch_chains={name: prompts["batch"][name] | llm for name in self.CHAIN_NAMES},
+            fused_chain=prompts["fused"] | llm
+        )
+    
+    def route(self, input_text, probabilities):
+        """Model tier for one post, always the reasoning tier without a router"""
+        if self.router is None:
+            return REASONING
+        tier, _ = self.router.route(input_text, probabilities)
+        self.metrics.increment("routes", tier=tier)
+        return tier
+    
+    def probabilities_batch(self, texts, batch_size=BATCH_SIZE, embeddings=False, ids=None):
+        """Full (negative, neutral, positive) probability rows for a list of texts
+
+        With embeddings=True, returns (probabilities, pooled embeddings) from the same forward passes.
+        ids are the texts' token ids from token_ids(), if they were already tokenized.
+        """
+        if self.long_text is not None:
+            return self.windowed_probabilities(texts, batch_size, embeddings, ids)
+        
+        probabilities = []
+        pooled = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            
+            with self.metrics.timer("tokenize"):
+                if ids is not None:
+                    encoded = self.encoder.collate(ids[start:start + batch_size])
+                elif self.token_cache is not None:
+                    encoded = self.encoder.collate(self.token_cache.get(batch))
+                else:
+                    encoded = self.encoder.encode(batch)
+            
+            # Softmax over all rows at once, embeddings only when asked since they cost memory
+            with self.metrics.timer("forward"):
+                output = self.encoder.outputs(encoded, embeddings=embeddings)
+            if embeddings:
+                probabilities.append(output[0])
+                pooled.append(output[1])
+            else:
+                probabilities.append(output)
+        
+        if not probabilities:
+            probabilities, pooled = np.empty((0, 3), dtype=np.float32), np.empty((0, 0), dtype=np.float32)
+        else:
+            probabilities = np.concatenate(probabilities)
+            pooled = np.concatenate(pooled) if embeddings else None
+        return (probabilities, pooled) if embeddings else probabilities
+    
+    @property
+    def needs_embeddings(self):
+        return self.reuse_index is not None or self.distilled is not None
+    
+    def encoder_rows(self, texts, ids=None):
+        """What the coalescer hands back per text, the probability row paired with the embedding when needed"""
+        if not self.needs_embeddings:
+            return self.probabilities_batch(texts, ids=ids)
+        return list(zip(*self.probabilities_batch(texts, embeddings=True, ids=ids)))
+    
+    def windowed_probabilities(self, texts, batch_size=BATCH_SIZE, embeddings=False, ids=None):
+        """Probability rows from every window of every text, reduced back to one row per text
+
+        Windows of all texts go through the encoder together in batch_size chunks, sorted by
+        length so short texts don't get padded up to full windows. Embeddings are the
+        length-weighted mean over windows whatever the reducer.
+        """
+        id_lists = ids if ids is not None else self.token_ids(texts)
+        
+        windows = []
+        owners = []
+        for i, ids in enumerate(id_lists):
+            for window in split_windows(np.asarray(ids), self.encoder.MAX_LENGTH, self.window_stride):
+                windows.append(window)
+                owners.append(i)
+        if not windows:
+            empty = np.empty((0, 3), dtype=np.float32)
+            return (empty, np.empty((0, 0), dtype=np.float32)) if embeddings else empty
+        
+        order = sorted(range(len(windows)), key=lambda w: len(windows[w]))
+        window_probabilities = np.empty((len(windows), 3), dtype=np.float32)
+        window_pooled = None
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            encoded = self.encoder.collate([windows[w] for w in chunk])
+            with self.metrics.timer("forward"):
+                output = self.encoder.outputs(encoded, embeddings=embeddings)
+            if not embeddings:
+                window_probabilities[chunk] = output
+                continue
+            chunk_probabilities, chunk_pooled = output
+            if window_pooled is None:
+                window_pooled = np.empty((len(windows), chunk_pooled.shape[1]), dtype=np.float32)
+            window_probabilities[chunk] = chunk_probabilities
+            window_pooled[chunk] = chunk_pooled
+        
+        reduce = REDUCERS[self.long_text]
+        owners = np.asarray(owners)
+        probabilities = np.empty((len(id_lists), 3), dtype=np.float32)
+        pooled = np.empty((len(id_lists), window_pooled.shape[1]), dtype=np.float32) if embeddings else None
+        for i in range(len(id_lists)):
+            rows = np.flatnonzero(owners == i)
+            lengths = [len(windows[w]) for w in rows]
+            probabilities[i] = reduce(window_probabilities[rows], lengths)
+            if embeddings:
+                pooled[i] = weighted_mean(window_pooled[rows], lengths)
+        return (probabilities, pooled) if embeddings else probabilities
+    
+    def score_batch(self, texts, batch_size=BATCH_SIZE):
+        """Score a list of texts with the encoder, returning positive-class probabilities"""
+        return self.probabilities_batch(texts, batch_size)[:, 2]
+    
+    def confident(self, probabilities):
+        """Whether the encoder's probability vector clears the configured gate"""
+        if self.gate is None:
+            return False
+        
+        if self.gate == "max_prob":
+            return probabilities.max() >= self.gate_threshold
+        if self.gate == "entropy":
+            entropy = -np.sum(probabilities * np.log(np.clip(probabilities, 1e-12, 1.0)))
+            return entropy <= self.gate_threshold
+        
+        top = np.sort(probabilities)[::-1]
+        return top[0] - top[1] >= self.gate_threshold
+    
+    def pretokenize(self, items):
+        """Fill the token cache for (post, comment) pairs ahead of scoring"""
+        if self.token_cache is None:
+            return 0
+        return self.token_cache.pretokenize([self.format_input(post, comment) for post, comment in items])
+    
+    def warmup(self):
+        """Pay for allocation and kernel selection up front instead of on the first real post"""
+        self.encoder.warmup(batch_size=min(self.batcher.max_batch_size, Encoder.WARMUP_BATCH))
+    
+    def compare_backends(self, texts, backends=None):
+        """Score difference (0-100 scale) between this agent's backend and the others"""
+        backends = backends or [name for name in BACKENDS if name not in ("fp16", self.encoder.backend)]
+        others = [get_encoder(name, self.nlp_model) for name in backends]
+        return parity_report(self.encoder, others, list(texts))
+    
+    def token_ids(self, texts):
+        """Token ids per text, untruncated in long-text mode, the coalescer buckets on them and reuses them"""
+        with self.metrics.timer("tokenize"):
+            if self.token_cache is not None:
+                return self.token_cache.get(list(texts))
+            if self.long_text is not None:
+                return self.encoder.tokenize(texts, truncation=False)["input_ids"]
+            return self.encoder.tokenize(texts, truncation=True, max_length=self.encoder.MAX_LENGTH)["input_ids"]
+    
+    async def call_llm(self, chain, inputs, name="llm", model_name=None):
+        """Every LLM request goes through here: limiter slot, hedging, rate-limit retries, error accounting"""
+        tokens = sum(len(str(value)) for value in inputs.values()) // 4 + self.ESTIMATED_OVERHEAD_TOKENS
+        model_name = model_name or self.model_name
+        
+        for attempt in range(self.LLM_RETRIES + 1):
+            try:
+                if self.hedger is None:
+                    return await self.request_llm(chain, inputs, name, model_name, tokens)
+                return await self.hedger.run(
+                    (name, model_name),
+                    lambda sent, hedged: self.request_llm(chain, inputs, name, model_name, tokens, sent, hedged),
+                    spare=lambda: self.limiter.can_hedge(tokens)
+                )
+            except Exception as e:
+                retryable = is_rate_limit_error(e) or is_timeout_error(e)
+                if retryable and attempt < self.LLM_RETRIES:
+                    self.llm_stats["retries"] += 1
+                    self.metrics.increment("llm_retries", chain=name)
+                    await asyncio.sleep(self.RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                self.metrics.increment("llm_failures", chain=name)
+                raise
+    
+    async def request_llm(self, chain, inputs, name, model_name, tokens, sent=None, hedged=False):
+        """One request, no retries, sets sent once it holds a limiter slot
+
+        A hedge takes one of the limiter's hedge slots instead of queueing for a regular one, and
+        raises NoHedgeSlot when there is none.
+        """
+        if hedged:
+            # Another hedge may have taken the last slot since the hedger checked
+            if not self.limiter.try_acquire_hedge(tokens):
+                raise NoHedgeSlot()
+        else:
+            with self.metrics.timer("limiter_wait", chain=name):
+                await self.limiter.acquire(tokens)
+        if sent is not None:
+            sent.set()
+        start = time.perf_counter()
+        try:
+            response = await chain.ainvoke(inputs)
+        except BaseException as e:
+            self.limiter.release(error=e, hedge=hedged)
+            if isinstance(e, Exception):  # Otherwise cancelled, not the provider's fault
+                self.metrics.observe("llm_request_seconds", time.perf_counter() - start, chain=name, model=model_name,
+                                     outcome="error")
+            raise
+        
+        latency = time.perf_counter() - start
+        self.limiter.release(latency=latency, hedge=hedged)
+        self.llm_stats["requests"] += 1
+        self.metrics.observe("llm_request_seconds", latency, chain=name, model=model_name, outcome="ok")
+        if self.hedger is not None:
+            self.hedger.observe((name, model_name), latency)
+        self.usage.record(usage_from(response), name, model_name)
+        return response
+    
+    async def run_chain(self, name, input_text, score, tier=REASONING):
         """Helper method to run a single chain asynchronously"""
+        tier = self.tiers[tier]
+        if self.cache is None:
+            refined, _ = await self.invoke_chain(tier.chains[name], input_text, score, name, tier.model_name)
+            return refined
+        
+        # Identical requests share one cache entry and, while in flight, one LLM call
+        score = self.cache.quantize(score)
+        key = self.cache.key(name, tier.model_name, input_text, score)
+        return await self.cache.get_or_compute(
+            key, lambda: self.invoke_chain(tier.chains[name], input_text, score, name, tier.model_name)
+        )
+    
+    async def invoke_chain(self, chain, input_text, score, name="llm", model_name=None):
+        """Call the LLM once, returning (score, parsed) where parsed is False on fallback"""
         try:
-            response = await chain.ainvoke({"input": input_text, "score": f"{score:.2f}"})
-            response_text = str(response)
-            numbers = re.findall(r"\b\d{1,3}\b", response_text)
-            if numbers:
-                return float(numbers[0])
+            response = await self.call_llm(chain, {"input": input_text, "score": f"{score:.2f}"}, name, model_name)
+            # Only the reply text, str(response) would also expose usage metadata and ids to the regex
+            response_text = getattr(response, "content", str(response))
+            refined = parse_score(response_text)
+            if refined is not None:
+                return refined, True
+            logging.error(f"No score in chain response, keeping {score:.2f}: {response_text[:80]}")
         except Exception as e:
-            logging.warning(f"Error processing chain response: {e}")
-        return score  # Fallback to current score
+            logging.error(f"Error processing chain response, keeping {score:.2f}: {e}")
+        self.llm_stats["fallbacks"] += 1
+        self.metrics.increment("llm_fallbacks", chain=name)
+        return score, False  # Fallback to current score
     
-    async def run_concurrent(self, post, comment=None):
-        """Async version of run method with concurrent chain execution"""
-        # Prepare input text
+    async def run_chain_batch(self, name, input_texts, scores, tier=REASONING):
+        """Run one chain over several posts in a single request, per-item calls for anything unparsed"""
+        model_name = self.tiers[tier].model_name
+        refined = [None] * len(input_texts)
+        keys = [None] * len(input_texts)
+        
+        # Anything already in the response cache stays out of the batch
+        if self.cache is not None:
+            scores = [self.cache.quantize(score) for score in scores]
+            for i, (input_text, score) in enumerate(zip(input_texts, scores)):
+                # Batched answers come from a different prompt than single-chain ones, like fused.{name}
+                keys[i] = self.cache.key(f"batch.{name}", model_name, input_text, score)
+                refined[i] = self.cache.get(keys[i])
+        
+        pending = [i for i, score in enumerate(refined) if score is None]
+        if len(pending) > 1:
+            items = "\n\n".join(
+                f"Item {i + 1}:\n{input_texts[i]}\nCurrent Score: {scores[i]:.2f}" for i in pending
+            )
+            try:
+                response = await self.call_llm(
+                    self.tiers[tier].batch_chains[name], {"items": items}, f"batch.{name}", model_name
+                )
+                parsed = parse_item_scores(getattr(response, "content", str(response)))
+                for i in pending:
+                    if i + 1 in parsed:
+                        refined[i] = parsed[i + 1]
+                        if self.cache is not None:
+                            self.cache.set(keys[i], refined[i])
+            except Exception as e:
+                logging.warning(f"Error processing batched {name} chain response: {e}")
+        
+        # Items the batch response didn't cover go through the regular single-post path
+        missing = [i for i, score in enumerate(refined) if score is None]
+        fallbacks = await asyncio.gather(*(self.run_chain(name, input_texts[i], scores[i], tier) for i in missing))
+        for i, score in zip(missing, fallbacks):
+            refined[i] = score
+        return refined
+    
+    async def run_fused(self, input_text, score, tier=REASONING):
+        """All five aspect adjustments from one request, per-chain calls for any aspect left out"""
+        model_name = self.tiers[tier].model_name
+        refined = {}
+        keys = {}
+        if self.cache is not None:
+            score = self.cache.quantize(score)
+            for name in self.chains:
+                keys[name] = self.cache.key(f"fused.{name}", model_name, input_text, score)
+                cached = self.cache.get(keys[name])
+                if cached is not None:
+                    refined[name] = cached
+        
+        if len(refined) < len(self.chains):
+            try:
+                response = await self.call_llm(
+                    self.tiers[tier].fused_chain, {"input": input_text, "score": f"{score:.2f}"}, "fused", model_name
+                )
+                parsed = parse_aspect_scores(getattr(response, "content", str(response)), self.chains)
+                for name, value in parsed.items():
+                    refined.setdefault(name, value)
+                    if self.cache is not None:
+                        self.cache.set(keys[name], value)
+            except Exception as e:
+                logging.warning(f"Error processing fused chain response: {e}")
+        
+        missing = [name for name in self.chains if name not in refined]
+        fallbacks = await asyncio.gather(*(self.run_chain(name, input_text, score, tier) for name in missing))
+        refined.update(zip(missing, fallbacks))
+        return [refined[name] for name in self.chains]
+    
+    async def refine_once(self, input_text, score, refinement, tier=REASONING):
+        """One refinement cycle for one post, returning one score per aspect"""
+        if refinement == "fused":
+            return await self.run_fused(input_text, score, tier)
+        
+        # Run all chains concurrently
+        return await asyncio.gather(*(self.run_chain(name, input_text, score, tier) for name in self.chains))
+    
+    def check_refinement(self, refinement):
+        if refinement not in self.REFINEMENT_MODES:
+            raise ValueError(f"Unknown refinement mode '{refinement}', expected one of {self.REFINEMENT_MODES}")
+        if refinement == "distilled" and self.distilled is None:
+            raise ValueError("The distilled mode needs distilled_head, a head saved by distill.py")
+        if refinement != "distilled" and self.llm is None:
+            raise ValueError("OpenAI API key must be provided either as argument or through environment variable")
+        return refinement
+    
+    def config_fingerprint(self, reuse=True):
+        """Hash of every setting that changes a score, so stored results from another setup aren't reused
+
+        reuse=False leaves out the reuse threshold, for the reuse index's own namespace.
+        """
+        config = {
+            "nlp_model": self.nlp_model,
+            "backend": self.encoder.backend,
+            "long_text": self.long_text,
+            "window_stride": self.window_stride,
+            "tiers": {name: tier.model_name for name, tier in self.tiers.items()},
+            "router": [self.router.max_easy_words, self.router.max_easy_entropy] if self.router else None,
+            "prompts": self.prompt_fingerprint,
+            "cycles": self.cycles,
+            "convergence": [self.convergence_epsilon, self.convergence_spread],
+            "refinement": self.refinement,
+            "gate": [self.gate, self.gate_threshold],
+            "reuse": self.reuse_index.threshold if reuse and self.reuse_index is not None else None,
+            "distilled": hashlib.sha256(self.distilled.weights.tobytes()).hexdigest() if self.distilled else None
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    
+    @staticmethod
+    def format_input(post, comment=None):
+        """Build the text the encoder and chains see for a post or a comment on it"""
         input_text = "Post: " + post
         if comment:
             input_text = f"Analyze this Comment: {comment}\nWithin the context of this {input_text}"
+        return input_text
+    
+    def converged(self, previous, current, results):
+        """True once another refinement cycle is unlikely to move the score"""
+        if self.convergence_epsilon is not None and abs(current - previous) < self.convergence_epsilon:
+            return True
+        if self.convergence_spread is not None and max(results) - min(results) <= self.convergence_spread:
+            return True
+        return False
+    
+    def apply_gate(self, result, probabilities):
+        """Mark and count the result against the confidence gate, True when refinement is skipped"""
+        if self.gate is None:
+            return False
+        result.gated = bool(self.confident(probabilities))
+        self.gate_stats["skipped" if result.gated else "refined"] += 1
+        return result.gated
+    
+    def apply_reuse(self, results, embeddings):
+        """Copy reusable neighbour scores into the results, returns which ones were reused"""
+        matches = self.reuse_index.lookup_many(embeddings)
+        for result, score in zip(results, matches):
+            if score is not None:
+                result.score = score
+                result.reused = True
+        return [score is not None for score in matches]
+    
+    def distilled_scores(self, probabilities, embeddings):
+        return [float(score) for score in self.distilled.predict(features(probabilities, embeddings))]
+    
+    def save_reuse_index(self):
+        """Persist the embedding index to reuse_index_path, if one was given"""
+        if self.reuse_index is not None:
+            self.reuse_index.save()
+    
+    async def analyze_concurrent(self, post, comment=None, refinement=None):
+        """Score a post and return a SentimentResult with the base score and cycles used
 
-        # Get base sentiment score
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = self.model.to(device)
+        refinement overrides the agent's default mode ("chains" or "fused") for this call.
+        """
+        refinement = self.check_refinement(refinement or self.refinement)
+        usage = Counter()
+        token = current_scope.set(Scope([usage]))
+        try:
+            with self.metrics.timer("post"):
+                result = await self.score_post(self.format_input(post, comment), refinement)
+        finally:
+            current_scope.reset(token)
+        result.usage = usage
+        return result
+    
+    async def scoped(self, scope, coroutine):
+        """Attribute the LLM usage of a coroutine to the scope's posts and cycle"""
+        token = current_scope.set(scope)
+        try:
+            return await coroutine
+        finally:
+            current_scope.reset(token)
+    
+    async def score_post(self, input_text, refinement):
+        # Get base sentiment score, the wait includes queueing in the coalescer
+        with self.metrics.timer("encoder"):
+            probabilities = await self.batcher.submit(input_text)
+        embedding = None
+        if self.needs_embeddings:
+            probabilities, embedding = probabilities
+        sentiment_score = float(probabilities[2]) * 100  # Convert to 0-100 scale
+        result = SentimentResult(score=sentiment_score, base_score=sentiment_score)
+        
+        # Confident encoder outputs skip the LLM chains entirely
+        if self.apply_gate(result, probabilities):
+            return result
         
-        encoded_text = self.tokenizer(input_text, return_tensors='pt').to(device)
-        output = self.model(**encoded_text)
+        # The distilled head stands in for the whole refinement loop
+        if refinement == "distilled":
+            result.score = self.distilled_scores(probabilities[None, :], embedding[None, :])[0]
+            return result
         
-        scores = output[0][0].detach().cpu().numpy()
-        scores = softmax(scores)
-        sentiment_score = scores[2] * 100  # Convert to 0-100 scale
+        # ...and so do close paraphrases of a post that was already refined
+        if self.reuse_index is not None and self.apply_reuse([result], embedding[None, :])[0]:
+            return result
+        
+        result.tier = tier = self.route(input_text, probabilities)
 
-        # Refine score through multiple cycles
-        for _ in range(self.CYCLES):
+        # Refine score until it settles or we run out of cycles
+        for cycle in range(1, self.cycles + 1):
+            current_scope.get().cycle = cycle
             try:
-                # Run all chains concurrently
-                results = await asyncio.gather(
-                    self.run_chain(self.aspect_chain, input_text, sentiment_score),
-                    self.run_chain(self.mood_chain, input_text, sentiment_score),
-                    self.run_chain(self.rhetoric_chain, input_text, sentiment_score),
-                    self.run_chain(self.reference_chain, input_text, sentiment_score),
-                    self.run_chain(self.dependency_chain, input_text, sentiment_score)
-                )
+                with self.metrics.timer("cycle", refinement=refinement, tier=tier):
+                    results = await self.refine_once(input_text, sentiment_score, refinement, tier)
                 
                 # Calculate new average
-                sentiment_score = sum(results) / len(results)
-                print(f"Refined score: {sentiment_score:.2f}")
+                previous, sentiment_score = sentiment_score, sum(results) / len(results)
+                result.cycles += 1
+                logging.debug(f"Refined score: {sentiment_score:.2f}")
+                
+                if self.converged(previous, sentiment_score, results):
+                    break
                 
             except Exception as e:
                 logging.error(f"Error during score refinement cycle: {e}")
                 break
         
-        return min(max(0, sentiment_score), 100)  # Clamp to 0-100 range
+        result.score = min(max(0, sentiment_score), 100)  # Clamp to 0-100 range
+        if self.reuse_index is not None and result.cycles:
+            self.reuse_index.add(embedding, result.score)
+        return result
+    
+    async def refine_batched(self, active, input_texts, results, batch_size, cycle=0, tier=REASONING):
+        """One cycle of batched chain requests, returning the per-aspect scores of every active item"""
+        batches = [active[start:start + batch_size] for start in range(0, len(active), batch_size)]
+        outputs = await asyncio.gather(*(
+            self.scoped(
+                Scope([results[i].usage for i in batch], cycle),
+                self.run_chain_batch(name, [input_texts[i] for i in batch], [results[i].score for i in batch], tier)
+            )
+            for batch in batches
+            for name in self.chains
+        ))
+        
+        per_item = []
+        chains = len(self.chains)
+        for b, batch in enumerate(batches):
+            chain_outputs = outputs[b * chains:(b + 1) * chains]
+            per_item.extend([scores[j] for scores in chain_outputs] for j in range(len(batch)))
+        return per_item
+    
+    async def refine_routed(self, active, input_texts, results, batch_size, cycle=0):
+        """One batched cycle with every tier's posts batched separately, results in the order of active"""
+        groups = {}
+        for i in active:
+            groups.setdefault(results[i].tier, []).append(i)
+        outputs = await asyncio.gather(*(
+            self.refine_batched(group, input_texts, results, batch_size, cycle, tier)
+            for tier, group in groups.items()
+        ))
+        
+        per_item = {}
+        for group, output in zip(groups.values(), outputs):
+            per_item.update(zip(group, output))
+        return [per_item[i] for i in active]
+    
+    async def analyze_many_concurrent(self, items, batch_size=REFINE_BATCH_SIZE, refinement=None):
+        """Score (post, comment) pairs, sending batch_size posts per chain request
+
+        One forward pass covers every item, and each refinement cycle sends one request per chain
+        per batch_size posts instead of one per post. Items converge and drop out individually.
+        In "fused" mode each post instead gets its own single all-aspects request per cycle. With a
+        fast tier, posts are routed first and each tier batches only its own posts.
+        """
+        refinement = self.check_refinement(refinement or self.refinement)
+        input_texts = [self.format_input(post, comment) for post, comment in items]
+        
+        loop = asyncio.get_running_loop()
+        embeddings = None
+        with self.metrics.timer("encoder"):
+            if self.needs_embeddings:
+                probabilities, embeddings = await loop.run_in_executor(
+                    None, lambda: self.probabilities_batch(input_texts, embeddings=True)
+                )
+            else:
+                probabilities = await loop.run_in_executor(None, self.probabilities_batch, input_texts)
+        
+        results = []
+        active = []
+        for i, row in enumerate(probabilities):
+            sentiment_score = float(row[2]) * 100
+            results.append(SentimentResult(score=sentiment_score, base_score=sentiment_score))
+            if not self.apply_gate(results[i], row):
+                active.append(i)
+        
+        if refinement == "distilled" and active:
+            for i, score in zip(active, self.distilled_scores(probabilities[active], embeddings[active])):
+                results[i].score = score
+            active = []
+        
+        if self.reuse_index is not None and active:
+            reused = self.apply_reuse([results[i] for i in active], embeddings[active])
+            active = [i for i, skip in zip(active, reused) if not skip]
+        
+        for i in active:
+            results[i].tier = self.route(input_texts[i], probabilities[i])
+        
+        for cycle in range(1, self.cycles + 1):
+            if not active:
+                break
+            try:
+                with self.metrics.timer("batch_cycle", refinement=refinement):
+                    if refinement == "fused":
+                        per_item = await asyncio.gather(*(
+                            self.scoped(
+                                Scope([results[i].usage], cycle),
+                                self.run_fused(input_texts[i], results[i].score, results[i].tier)
+                            )
+                            for i in active
+                        ))
+                    else:
+                        per_item = await self.refine_routed(active, input_texts, results, batch_size, cycle)
+            except Exception as e:
+                logging.error(f"Error during batched score refinement cycle: {e}")
+                break
+            
+            still_active = []
+            for i, chain_results in zip(active, per_item):
+                previous = results[i].score
+                results[i].score = sum(chain_results) / len(chain_results)
+                results[i].cycles += 1
+                if not self.converged(previous, results[i].score, chain_results):
+                    still_active.append(i)
+            active = still_active
+        
+        for i, result in enumerate(results):
+            result.score = min(max(0, result.score), 100)  # Clamp to 0-100 range
+            if self.reuse_index is not None and result.cycles:
+                self.reuse_index.add(embeddings[i], result.score)
+        return results
+    
+    async def run_concurrent(self, post, comment=None):
+        """Async version of run method with concurrent chain execution"""
+        return (await self.analyze_concurrent(post, comment)).score
+    
+    def analyze(self, post, comment=None, refinement=None):
+        """Synchronous wrapper returning the full SentimentResult"""
+        return asyncio.run(self.analyze_concurrent(post, comment, refinement))
+    
+    def analyze_many(self, items, batch_size=REFINE_BATCH_SIZE, refinement=None):
+        """Synchronous wrapper for analyze_many_concurrent"""
+        return asyncio.run(self.analyze_many_concurrent(items, batch_size, refinement))
     
     def run(self, post, comment=None):
         """Synchronous wrapper for the async method"""
-        return asyncio.run(self.run_concurrent(post, comment))
\ No newline at end of file
+        return asyncio.run(self.run_concurrent(post, comment))
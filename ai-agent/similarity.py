@@ -0,0 +1,145 @@
+import logging
+import os
+from collections import Counter
+import numpy as np
+
+
+class EmbeddingIndex:
+    """Brute-force cosine nearest-neighbour index of encoder embeddings and their refined scores
+
+    Vectors are L2-normalized on the way in, so one matrix product scores a query against every
+    entry. Once max_entries is reached the least recently matched (or added) entry is overwritten.
+    """
+
+    MAX_ENTRIES = 20_000  # ~60 MB of float32 at 768 dims, a full scan stays around a millisecond
+    THRESHOLD = 0.97
+
+    def __init__(self, threshold=THRESHOLD, max_entries=MAX_ENTRIES, path=None, namespace=""):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.namespace = namespace  # e.g. the encoder model, embeddings from another model don't compare
+
+        self.vectors = None
+        self.scores = np.empty(0, dtype=np.float32)
+        self.last_used = np.empty(0, dtype=np.int64)
+        self.size = 0
+        self.clock = 0
+        self.stats = Counter()
+        self.added = None  # (vector, score) pairs added since record_additions(), see parallel.py
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _allocate(self, dim):
+        self.vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self.scores = np.zeros(self.max_entries, dtype=np.float32)
+        self.last_used = np.zeros(self.max_entries, dtype=np.int64)
+
+    def lookup_many(self, vectors):
+        """Reusable score (or None) for each vector, None unless the nearest entry clears the threshold"""
+        vectors = self.normalize(vectors)
+        self.stats["lookups"] += len(vectors)
+        if not self.size:
+            self.stats["misses"] += len(vectors)
+            return [None] * len(vectors)
+
+        similarities = vectors @ self.vectors[:self.size].T
+        nearest = similarities.argmax(axis=1)
+
+        matches = []
+        for row, slot in enumerate(nearest):
+            if similarities[row, slot] >= self.threshold:
+                self.clock += 1
+                self.last_used[slot] = self.clock
+                self.stats["hits"] += 1
+                matches.append(float(self.scores[slot]))
+            else:
+                self.stats["misses"] += 1
+                matches.append(None)
+        return matches
+
+    def lookup(self, vector):
+        return self.lookup_many(vector)[0]
+
+    def add(self, vector, score):
+        """Store a refined score, evicting the least recently used entry when full"""
+        vector = self.normalize(vector)[0]
+        if self.vectors is None:
+            self._allocate(len(vector))
+
+        if self.size < self.max_entries:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = int(self.last_used.argmin())
+            self.stats["evictions"] += 1
+
+        self.clock += 1
+        self.vectors[slot] = vector
+        self.scores[slot] = score
+        self.last_used[slot] = self.clock
+        if self.added is not None:
+            self.added.append((vector, score))
+
+    def record_additions(self):
+        """Start keeping every new entry in self.added, e.g. to send a forked worker's entries back"""
+        self.added = []
+
+    def add_many(self, vectors, scores):
+        for vector, score in zip(vectors, scores):
+            self.add(vector, score)
+
+    @property
+    def reuse_rate(self):
+        if not self.stats["lookups"]:
+            return 0.0
+        return self.stats["hits"] / self.stats["lookups"]
+
+    def report(self):
+        return {
+            "entries": self.size,
+            "lookups": self.stats["lookups"],
+            "reused": self.stats["hits"],
+            "evictions": self.stats["evictions"],
+            "reuse_rate": round(self.reuse_rate, 4)
+        }
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path or self.vectors is None:
+            return
+
+        # np.savez appends .npz to names without it, write to a temp name that already has it
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=self.vectors[:self.size],
+            scores=self.scores[:self.size],
+            last_used=self.last_used[:self.size],
+            namespace=np.array(self.namespace)
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            if str(data["namespace"]) != self.namespace:
+                logging.info(f"Ignoring embedding index {path}, it was built for a different model")
+                return
+            vectors = data["vectors"]
+            if not len(vectors):
+                return
+
+            # Keep the most recently used entries when the cap shrank since the index was saved
+            keep = np.argsort(data["last_used"])[-self.max_entries:]
+            self._allocate(vectors.shape[1])
+            self.size = len(keep)
+            self.vectors[:self.size] = vectors[keep]
+            self.scores[:self.size] = data["scores"][keep]
+            self.last_used[:self.size] = np.arange(1, self.size + 1)
+            self.clock = self.size
@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+import torch
+
+# The agent's modules are flat files in ai-agent/, one level up from these tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoders import Encoder  # noqa: E402
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with RoBERTa's special ids (<s>=0, pad=1, </s>=2), deterministic word ids"""
+
+    name_or_path = "stub-tokenizer"
+    pad_token_id = 1
+    eos_token_id = 2
+    VOCAB = 50
+
+    def __len__(self):
+        return self.VOCAB
+
+    def word_id(self, word):
+        return 3 + sum(map(ord, word)) % (self.VOCAB - 3)
+
+    def __call__(self, texts, truncation=False, max_length=None, **kwargs):
+        rows = []
+        for text in texts:
+            ids = [0] + [self.word_id(word) for word in text.split()] + [2]
+            if truncation and max_length and len(ids) > max_length:
+                ids = ids[:max_length - 1] + [2]
+            rows.append(ids)
+        return {"input_ids": rows}
+
+
+class StubEncoder(Encoder):
+    """Offline encoder: the share of even word ids decides the label, the pooled vector is a bag of ids"""
+
+    backend = "stub"
+    MAX_LENGTH = 16  # Small, so windowing and truncation show up with short texts
+
+    def __init__(self, nlp_model="stub", num_threads=1, device=None):
+        self.nlp_model = nlp_model
+        self.num_threads = num_threads
+        self.device = torch.device("cpu")
+        self.warm = False
+        self.tokenizer = StubTokenizer()
+        self.tokenizer_lock = threading.Lock()
+
+    def encode(self, texts):
+        return self.collate(self.tokenize(texts, truncation=True, max_length=self.MAX_LENGTH)["input_ids"])
+
+    def forward(self, encoded, embeddings=False):
+        ids = encoded["input_ids"].numpy()
+        mask = encoded["attention_mask"].numpy().astype(bool)
+        logits = np.zeros((len(ids), 3), dtype=np.float32)
+        pooled = np.zeros((len(ids), 8), dtype=np.float32)
+        for row, (row_ids, row_mask) in enumerate(zip(ids, mask)):
+            words = row_ids[row_mask][1:-1]
+            even = np.mean(words % 2 == 0) if len(words) else 0.5
+            logits[row] = [4 * (0.5 - even), 0.0, 4 * (even - 0.5)]
+            np.add.at(pooled[row], words % 8, 1.0)
+        return logits, (pooled if embeddings else None)
+
+
+@pytest.fixture
+def stub_encoder():
+    return StubEncoder()
+
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    """SentimentAgent factory on the stub encoder and the in-process fake LLM, no network or model download"""
+    import sentiment_agent
+    from fake_llm import FakeChatModel
+
+    encoder = StubEncoder()
+    monkeypatch.setattr(sentiment_agent, "get_encoder", lambda *args, **kwargs: encoder)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    def make(**kwargs):
+        kwargs.setdefault("llm", FakeChatModel(latency_ms=0))
+        kwargs.setdefault("nlp_model", "stub")
+        return sentiment_agent.SentimentAgent(**kwargs)
+
+    return make
@@ -0,0 +1,45 @@
+from sentiment_agent import parse_item_scores
+
+
+def test_parse_item_scores_array():
+    text = 'Sure: [{"id": 0, "score": 40}, {"id": 1, "score": "72.5"}]'
+    assert parse_item_scores(text) == {0: 40.0, 1: 72.5}
+
+
+def test_parse_item_scores_object_keyed_by_id():
+    assert parse_item_scores('{"0": 10, "2": 90}') == {0: 10.0, 2: 90.0}
+
+
+def test_parse_item_scores_skips_bad_entries():
+    text = '[{"id": 0, "score": 150}, {"id": "x", "score": 50}, {"id": 2}, "noise", {"id": 3, "score": -1}, {"id": 4, "score": 0}]'
+    assert parse_item_scores(text) == {4: 0.0}
+
+
+def test_parse_item_scores_without_json():
+    assert parse_item_scores("no scores here") == {}
+    assert parse_item_scores("[not json]") == {}
+
+
+def test_analyze_many_sends_one_request_per_chain_per_batch(make_agent):
+    agent = make_agent(cycles=1)
+    items = [(f"post number {i} about eth", None) for i in range(10)]
+
+    results = agent.analyze_many(items, batch_size=8)
+
+    assert len(results) == 10
+    assert all(result.cycles == 1 for result in results)
+    assert agent.llm.fake.requests == len(agent.chains) * 2
+    assert agent.llm_stats["fallbacks"] == 0
+
+
+def test_unparsed_items_fall_back_to_single_requests(make_agent):
+    agent = make_agent(cycles=1)
+    reply = agent.llm.fake.reply
+    # Drop item 1 from every batched answer
+    agent.llm.fake.reply = lambda prompt: reply(prompt).replace('{"id": 1, ', '{"id": 99, ')
+
+    results = agent.analyze_many([("first post", None), ("second post", None)], batch_size=8)
+
+    assert all(result.cycles == 1 for result in results)
+    # One batched request plus one single-post retry per chain
+    assert agent.llm.fake.requests == len(agent.chains) * 2
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from batching import BatchCoalescer
+
+
+class Recorder:
+    """score_fn/tokenize_fn pair over the stub encoder that records every call"""
+
+    def __init__(self, encoder, delay=0.0, error=None):
+        self.encoder = encoder
+        self.delay = delay
+        self.error = error
+        self.tokenized = []
+        self.batches = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def tokenize(self, texts):
+        self.tokenized.append(list(texts))
+        return self.encoder.tokenize(texts, truncation=True, max_length=self.encoder.MAX_LENGTH)["input_ids"]
+
+    def score(self, texts, ids):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            self.batches.append((list(texts), [list(row) for row in ids]))
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return self.encoder.probabilities_from_ids(ids)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def submit_all(coalescer, texts):
+    async def main():
+        return await asyncio.gather(*(coalescer.submit(text) for text in texts), return_exceptions=True)
+    return asyncio.run(main())
+
+
+def test_concurrent_submits_share_one_forward_pass(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=8, length_buckets=(64,))
+    texts = [f"post {i} about eth" for i in range(5)]
+
+    results = submit_all(coalescer, texts)
+
+    assert len(recorder.batches) == 1 and len(recorder.tokenized) == 1
+    expected = stub_encoder.probabilities(texts)
+    assert np.allclose(np.stack(results), expected)
+
+
+def test_forward_pass_reuses_the_tokenized_ids(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=8)
+
+    submit_all(coalescer, ["gm frens", "wen moon"])
+
+    texts, ids = recorder.batches[0]
+    assert ids == stub_encoder.tokenize(texts)["input_ids"]
+
+
+def test_full_batches_are_split_by_max_batch_size(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=4, length_buckets=(64,))
+
+    results = submit_all(coalescer, [f"post {i}" for i in range(10)])
+
+    assert len(results) == 10
+    assert all(len(texts) <= 4 for texts, _ in recorder.batches)
+    assert sum(len(texts) for texts, _ in recorder.batches) == 10
+
+
+def test_texts_are_bucketed_by_length(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=8, length_buckets=(4, 16))
+    short, long = ["gm", "hi"], ["a much longer post about the merge", "and another long one here"]
+
+    submit_all(coalescer, [short[0], long[0], short[1], long[1]])
+
+    assert [texts for texts, _ in recorder.batches] == [short, long]
+
+
+def test_texts_queued_behind_a_running_batch_go_out_together(stub_encoder):
+    recorder = Recorder(stub_encoder, delay=0.05)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=32, max_wait_ms=1)
+
+    async def main():
+        first = asyncio.ensure_future(coalescer.submit("first"))
+        await asyncio.sleep(0.02)  # The first batch is now running
+        rest = await asyncio.gather(*(coalescer.submit(f"queued {i}") for i in range(5)))
+        return [await first] + rest
+
+    assert len(asyncio.run(main())) == 6
+    assert [len(texts) for texts, _ in recorder.batches] == [1, 5]
+    assert recorder.max_running == 1
+
+
+def test_each_event_loop_starts_fresh(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=8)
+
+    first = submit_all(coalescer, ["gm frens"])
+    second = submit_all(coalescer, ["gm frens"])
+
+    assert np.allclose(first[0], second[0])
+    assert len(recorder.batches) == 2
+
+
+def test_errors_reach_every_pending_submit(stub_encoder):
+    recorder = Recorder(stub_encoder, error=RuntimeError("encoder crashed"))
+    coalescer = BatchCoalescer(recorder.score, recorder.tokenize, max_batch_size=8)
+
+    results = submit_all(coalescer, ["one", "two", "three"])
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # The coalescer still works afterwards
+    recorder.error = None
+    assert not isinstance(submit_all(coalescer, ["four"])[0], Exception)
+
+
+def test_agent_batcher_matches_direct_scoring(make_agent):
+    agent = make_agent()
+    texts = [f"post {i} about eth and gas" for i in range(6)]
+
+    async def main():
+        return await asyncio.gather(*(agent.batcher.submit(text) for text in texts))
+
+    assert np.allclose(np.stack(asyncio.run(main())), agent.probabilities_batch(texts))
+
+
+def test_wrong_result_count_fails_instead_of_hanging(stub_encoder):
+    recorder = Recorder(stub_encoder)
+    coalescer = BatchCoalescer(lambda texts, ids: recorder.score(texts, ids)[:1], recorder.tokenize, max_batch_size=8)
+
+    results = submit_all(coalescer, ["one", "two", "three"])
+
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+import benchmark
+
+
+def _dies(queue, config, items, options):
+    os._exit(137)
+
+
+def _reports(queue, config, items, options):
+    queue.put(dict(config, posts=len(items)))
+
+
+def run_with(monkeypatch, target):
+    # fork keeps the patched target, spawn would re-import the real one
+    monkeypatch.setattr(benchmark, "_isolated", target)
+    monkeypatch.setattr(benchmark, "RESULT_POLL_SECONDS", 0.2)
+    fork = multiprocessing.get_context("fork")
+    monkeypatch.setattr(benchmark.multiprocessing, "get_context", lambda method: fork)
+    return benchmark.run_isolated({"batch_size": 8}, [("post", None)], {})
+
+
+def test_isolated_result_comes_back(monkeypatch):
+    assert run_with(monkeypatch, _reports) == {"batch_size": 8, "posts": 1}
+
+
+def test_dead_child_is_reported_instead_of_hanging(monkeypatch):
+    assert run_with(monkeypatch, _dies) == {"batch_size": 8, "error": "benchmark process died with exit code 137"}
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import pandas as pd
+from runner import Checkpoint, run_sentiment_analysis_streaming
+
+
+def write_csv(path, rows=4):
+    pd.DataFrame({
+        "Submission": [f"post {i} about eth" for i in range(rows)],
+        "Comment": [None, "a comment", None, "another comment"][:rows],
+        "Sentiment Score": ["neu"] * rows
+    }).to_csv(path, index=False)
+
+
+def test_resume_from_matching_fingerprint(tmp_path):
+    path = str(tmp_path / "out.csv.checkpoint.jsonl")
+    checkpoint = Checkpoint(path, "abc")
+    checkpoint.record(Checkpoint.row_key("post", None), 42.0, 2)
+    checkpoint.close()
+
+    resumed = Checkpoint(path, "abc")
+    assert resumed.done == {Checkpoint.row_key("post", None): (42.0, 2)}
+    assert not resumed.stale
+    resumed.close()
+
+
+def test_half_written_line_is_skipped(tmp_path):
+    path = str(tmp_path / "out.csv.checkpoint.jsonl")
+    checkpoint = Checkpoint(path, "abc")
+    checkpoint.record("done", 10.0, 1)
+    checkpoint.file.write('{"key": "crashed", "sco')
+    checkpoint.close()
+
+    resumed = Checkpoint(path, "abc")
+    assert list(resumed.done) == ["done"]
+    resumed.close()
+
+
+def test_other_fingerprint_is_discarded(tmp_path):
+    path = str(tmp_path / "out.csv.checkpoint.jsonl")
+    checkpoint = Checkpoint(path, "old-config")
+    checkpoint.record("row", 10.0, 1)
+    checkpoint.close()
+
+    fresh = Checkpoint(path, "new-config")
+    fresh.close()
+    assert fresh.stale and not fresh.done
+    # ...and overwritten, so the next run with the new config doesn't see the old rows either
+    assert Checkpoint(path, "new-config").done == {}
+
+
+def test_streaming_run_resumes_and_removes_checkpoint(make_agent, tmp_path):
+    input_csv, output_csv = str(tmp_path / "in.csv"), str(tmp_path / "out.csv")
+    write_csv(input_csv)
+    agent = make_agent(cycles=1)
+
+    # Pretend a crashed run already scored the first row
+    checkpoint = Checkpoint(output_csv + ".checkpoint.jsonl", agent.config_fingerprint())
+    checkpoint.record(Checkpoint.row_key("post 0 about eth", None), 12.0, 1)
+    checkpoint.close()
+
+    asyncio.run(run_sentiment_analysis_streaming(input_csv, output_csv, agent=agent))
+
+    output = pd.read_csv(output_csv)
+    assert output["predicted_sentiment_score"].iloc[0] == 12.0
+    assert agent.llm.fake.requests == 3 * len(agent.chains)
+    assert not os.path.exists(output_csv + ".checkpoint.jsonl")
+
+
+def test_config_change_rescores_everything(make_agent, tmp_path):
+    input_csv, output_csv = str(tmp_path / "in.csv"), str(tmp_path / "out.csv")
+    write_csv(input_csv)
+    first = make_agent(cycles=1)
+    checkpoint = Checkpoint(output_csv + ".checkpoint.jsonl", first.config_fingerprint())
+    checkpoint.record(Checkpoint.row_key("post 0 about eth", None), 12.0, 1)
+    checkpoint.close()
+
+    second = make_agent(cycles=2, convergence_epsilon=None, convergence_spread=None)
+    assert second.config_fingerprint() != first.config_fingerprint()
+    asyncio.run(run_sentiment_analysis_streaming(input_csv, output_csv, agent=second))
+
+    assert second.llm.fake.requests == 4 * 2 * len(second.chains)
+
+
+def test_failed_rows_keep_the_checkpoint_for_a_rerun(make_agent, tmp_path, capsys):
+    input_csv, output_csv = str(tmp_path / "in.csv"), str(tmp_path / "out.csv")
+    write_csv(input_csv)
+    agent = make_agent(cycles=1)
+    analyze = agent.analyze_concurrent
+
+    async def flaky(post, comment=None):
+        if post in ("post 1 about eth", "post 3 about eth"):
+            raise RuntimeError("boom")
+        return await analyze(post, comment)
+
+    agent.analyze_concurrent = flaky
+    asyncio.run(run_sentiment_analysis_streaming(input_csv, output_csv, agent=agent))
+
+    assert pd.read_csv(output_csv)["predicted_sentiment_score"].isna().sum() == 2
+    assert os.path.exists(output_csv + ".checkpoint.jsonl")
+    assert "2 rows failed" in capsys.readouterr().out
+
+    # The rerun only scores the two failed rows, then the checkpoint goes away
+    rerun = make_agent(cycles=1)
+    asyncio.run(run_sentiment_analysis_streaming(input_csv, output_csv, agent=rerun))
+
+    assert rerun.llm.fake.requests == 2 * len(rerun.chains)
+    assert pd.read_csv(output_csv)["predicted_sentiment_score"].notna().all()
+    assert not os.path.exists(output_csv + ".checkpoint.jsonl")
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+import pytest
+from dedup import Deduplicator, normalize, simhash
+
+
+@dataclass
+class Result:
+    score: float
+
+
+def test_normalize_ignores_case_links_and_whitespace():
+    assert normalize("  Check   [THIS](https://x.io) out https://y.io ") == "check this out"
+
+
+def test_exact_duplicates_collapse_to_first():
+    dedup = Deduplicator()
+    texts = ["Moon soon", "moon  SOON", "Dump it", "moon soon"]
+
+    assert dedup.collapse(texts) == [0, 2]
+    assert dedup.assignment == [0, 0, 1, 0]
+    assert dedup.report()["exact_duplicates"] == 2
+
+
+def test_expand_copies_results_per_text():
+    dedup = Deduplicator()
+    dedup.collapse(["a b", "A B", "c d"])
+
+    expanded = dedup.expand([Result(10.0), Result(90.0)])
+
+    assert [result.score for result in expanded] == [10.0, 10.0, 90.0]
+    # Copies, so per-row edits don't leak into the duplicates
+    assert expanded[0] is not expanded[1]
+
+
+def test_near_duplicates_need_the_flag_and_enough_words():
+    # Punctuation isn't a SimHash feature, but it does make the normalized texts differ
+    text = "the merge went smoothly and gas fees dropped a lot today"
+    near = text + " !!"
+    assert normalize(text) != normalize(near)
+    assert simhash(normalize(text)) == simhash(normalize(near))
+
+    assert Deduplicator().collapse([text, near]) == [0, 1]
+    assert Deduplicator(near_duplicates=True).collapse([text, near]) == [0]
+    assert Deduplicator(near_duplicates=True, min_words=50).collapse([text, near]) == [0, 1]
+
+
+def test_unrelated_texts_stay_apart():
+    texts = ["bitcoin dominance keeps climbing this cycle for sure",
+             "my staking node went offline during the night again"]
+    assert Deduplicator(near_duplicates=True).collapse(texts) == [0, 1]
+
+
+def test_max_distance_must_fit_the_bands():
+    with pytest.raises(ValueError):
+        Deduplicator(near_duplicates=True, max_distance=Deduplicator.BANDS)
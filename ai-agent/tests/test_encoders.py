@@ -0,0 +1,36 @@
+import os
+from encoders import model_fingerprint
+
+
+def write_model(directory, weights=b"\0" * 16, config='{"model_type": "roberta"}'):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        f.write(config)
+    with open(os.path.join(directory, "model.safetensors"), "wb") as f:
+        f.write(weights)
+
+
+def test_fingerprint_is_stable(tmp_path):
+    write_model(str(tmp_path))
+    assert model_fingerprint(str(tmp_path)) == model_fingerprint(str(tmp_path))
+
+
+def test_fingerprint_follows_config_and_weights(tmp_path):
+    write_model(str(tmp_path))
+    before = model_fingerprint(str(tmp_path))
+
+    write_model(str(tmp_path), config='{"model_type": "roberta", "num_labels": 3}')
+    after_config = model_fingerprint(str(tmp_path))
+    write_model(str(tmp_path), config='{"model_type": "roberta", "num_labels": 3}', weights=b"\1" * 32)
+    after_weights = model_fingerprint(str(tmp_path))
+
+    assert len({before, after_config, after_weights}) == 3
+
+
+def test_fingerprint_ignores_other_files(tmp_path):
+    write_model(str(tmp_path))
+    before = model_fingerprint(str(tmp_path))
+    with open(os.path.join(str(tmp_path), "README.md"), "w") as f:
+        f.write("notes")
+
+    assert model_fingerprint(str(tmp_path)) == before
@@ -0,0 +1,39 @@
+from sentiment_agent import SentimentAgent, parse_aspect_scores
+
+NAMES = SentimentAgent.CHAIN_NAMES
+
+
+def test_parse_aspect_scores():
+    text = 'Here you go: {"aspect": 40, "mood": "55", "rhetoric": 61.5, "reference": 0, "dependency": 100}'
+    assert parse_aspect_scores(text, NAMES) == {
+        "aspect": 40.0, "mood": 55.0, "rhetoric": 61.5, "reference": 0.0, "dependency": 100.0
+    }
+
+
+def test_parse_aspect_scores_drops_missing_and_off_scale():
+    text = '{"aspect": 101, "mood": "n/a", "rhetoric": 30, "extra": 50}'
+    assert parse_aspect_scores(text, NAMES) == {"rhetoric": 30.0}
+
+
+def test_parse_aspect_scores_without_object():
+    assert parse_aspect_scores("72", NAMES) == {}
+    assert parse_aspect_scores("{broken", NAMES) == {}
+
+
+def test_fused_mode_sends_one_request_per_cycle(make_agent):
+    agent = make_agent(cycles=1, refinement="fused")
+
+    result = agent.analyze("one fused post")
+
+    assert result.cycles == 1
+    assert agent.llm.fake.requests == 1
+
+
+def test_fused_mode_fills_missing_aspects_with_single_chains(make_agent):
+    agent = make_agent(cycles=1, refinement="fused")
+    agent.llm.fake.reply = lambda prompt: '{"aspect": 50, "mood": 50}' if "JSON object" in prompt else "60"
+
+    result = agent.analyze("one fused post")
+
+    assert agent.llm.fake.requests == 1 + 3
+    assert result.score == (50 + 50 + 60 * 3) / 5
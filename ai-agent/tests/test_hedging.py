@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+from fake_llm import FakeChatModel
+from hedging import Hedger, NoHedgeSlot
+
+KEY = ("mood", "model")
+
+
+def primed(**kwargs):
+    """Hedger that hedges after 20 ms, with the budget wide open unless a test narrows it"""
+    kwargs.setdefault("max_ratio", 1.0)
+    hedger = Hedger(min_delay=0.02, **kwargs)
+    for _ in range(hedger.min_samples):
+        hedger.observe(KEY, 0.001)
+    return hedger
+
+
+def fake_request(primary_s, hedge_s=0.0, queue_s=0.0, primary_error=None, hedge_error=None, hedge_slot=True):
+    """request(sent, hedged) that sleeps, optionally fails, and records what happened"""
+    calls = {"primary": 0, "hedge": 0, "cancelled": []}
+
+    async def request(sent, hedged):
+        role = "hedge" if hedged else "primary"
+        calls[role] += 1
+        if hedged and not hedge_slot:
+            raise NoHedgeSlot()
+        if not hedged:
+            await asyncio.sleep(queue_s)  # Waiting for a limiter slot
+        if sent is not None:
+            sent.set()
+        try:
+            await asyncio.sleep(hedge_s if hedged else primary_s)
+        except asyncio.CancelledError:
+            calls["cancelled"].append(role)
+            raise
+        error = hedge_error if hedged else primary_error
+        if error is not None:
+            raise error
+        return role
+
+    return request, calls
+
+
+def run(hedger, request, spare=None):
+    async def main():
+        result = await hedger.run(KEY, request, spare)
+        await asyncio.sleep(0)  # Let the cancelled loser see its CancelledError
+        return result
+    return asyncio.run(main())
+
+
+def test_no_hedging_until_enough_samples():
+    request, calls = fake_request(0.05)
+
+    assert run(Hedger(min_delay=0.02), request) == "primary"
+    assert calls["hedge"] == 0
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = primed()
+    request, calls = fake_request(0.001)
+
+    assert run(hedger, request) == "primary"
+    assert calls["hedge"] == 0 and hedger.stats["hedged"] == 0
+
+
+def test_slow_primary_loses_to_the_hedge_and_is_cancelled():
+    hedger = primed()
+    request, calls = fake_request(0.5, hedge_s=0.001)
+
+    assert run(hedger, request) == "hedge"
+    assert calls["cancelled"] == ["primary"]
+    assert hedger.report()["hedge_wins"] == 1 and hedger.stats["hedged"] == 1
+
+
+def test_slow_hedge_loses_and_is_cancelled():
+    hedger = primed()
+    request, calls = fake_request(0.03, hedge_s=0.5)
+
+    assert run(hedger, request) == "primary"
+    assert calls["cancelled"] == ["hedge"]
+    assert hedger.stats["lost"] == 1
+
+
+def test_time_queueing_for_a_slot_does_not_count():
+    hedger = primed()
+    request, calls = fake_request(0.001, queue_s=0.05)
+
+    assert run(hedger, request) == "primary"
+    assert calls["hedge"] == 0
+
+
+def test_budget_caps_hedges():
+    hedger = primed(max_ratio=0.5)
+    request, calls = fake_request(0.2, hedge_s=0.001)
+
+    results = [run(hedger, request) for _ in range(4)]
+
+    assert hedger.stats["hedged"] == 2 and hedger.stats["budget_denied"] == 2
+    assert results.count("hedge") == 2
+
+
+def test_no_spare_capacity_means_no_hedge():
+    hedger = primed()
+    request, calls = fake_request(0.03)
+
+    assert run(hedger, request, spare=lambda: False) == "primary"
+    assert calls["hedge"] == 0
+
+
+def test_hedge_without_a_slot_is_not_charged():
+    hedger = primed()
+    request, calls = fake_request(0.03, hedge_slot=False)
+
+    assert run(hedger, request, spare=lambda: True) == "primary"
+    assert calls["hedge"] == 1
+    assert hedger.stats["hedged"] == 0 and hedger.stats["no_slot"] == 1
+
+
+def test_both_failing_raises_the_primary_error():
+    hedger = primed()
+    request, _ = fake_request(0.03, hedge_s=0.001, primary_error=TimeoutError("primary"),
+                              hedge_error=RuntimeError("hedge"))
+
+    with pytest.raises(TimeoutError, match="primary"):
+        run(hedger, request)
+    assert hedger.stats["failed"] == 1
+
+
+def test_failed_hedge_falls_back_to_the_primary():
+    hedger = primed()
+    request, _ = fake_request(0.03, hedge_s=0.001, hedge_error=RuntimeError("hedge"))
+
+    assert run(hedger, request) == "primary"
+
+
+def test_agent_hedges_slow_requests_within_budget(make_agent):
+    hedger = Hedger(min_samples=10, min_delay=0.005)
+    agent = make_agent(cycles=1, hedger=hedger, llm=FakeChatModel(latency_ms=5, latency_sigma=1.0, seed=1))
+
+    async def main():
+        # A few posts at a time, so latencies are observed before most requests go out
+        semaphore = asyncio.Semaphore(4)
+
+        async def score(i):
+            async with semaphore:
+                return await agent.analyze_concurrent(f"post number {i}")
+
+        return await asyncio.gather(*(score(i) for i in range(40)))
+
+    results = asyncio.run(main())
+
+    report = hedger.report()
+    assert len(results) == 40 and agent.llm_stats["fallbacks"] == 0
+    assert 0 < report["hedged"] <= hedger.max_ratio * report["requests"]
+    # Every hedge that went out held a slot and gave it back
+    assert agent.limiter.hedges_active == 0
+    # A loser cancelled while still inside LangChain never reaches the model
+    assert report["requests"] < agent.llm.fake.requests <= report["requests"] + report["hedged"]
+
+
+def test_agent_hedge_losing_the_slot_race_is_not_charged(make_agent, monkeypatch):
+    hedger = Hedger(min_samples=10, min_delay=0.005)
+    agent = make_agent(cycles=1, hedger=hedger, llm=FakeChatModel(latency_ms=5, latency_sigma=1.0, seed=1))
+    monkeypatch.setattr(agent.limiter, "try_acquire_hedge", lambda tokens=0: False)
+
+    async def main():
+        # A few posts at a time, so latencies are observed before most requests go out
+        semaphore = asyncio.Semaphore(4)
+
+        async def score(i):
+            async with semaphore:
+                return await agent.analyze_concurrent(f"post number {i}")
+
+        return await asyncio.gather(*(score(i) for i in range(40)))
+
+    asyncio.run(main())
+
+    assert hedger.stats["no_slot"] > 0
+    assert hedger.stats["hedged"] == 0 and hedger.stats["budget_denied"] == 0
+    assert agent.llm.fake.requests == hedger.stats["requests"]
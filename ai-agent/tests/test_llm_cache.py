@@ -0,0 +1,109 @@
+import asyncio
+from langchain_core.prompts import ChatPromptTemplate
+import prompts
+from llm_cache import ResponseCache
+
+
+def test_set_get_and_key_normalization(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    key = cache.key("mood", "model", "gm  frens\n", 50.4)
+
+    assert cache.get(key) is None
+    cache.set(key, 72.0)
+
+    assert cache.get(cache.key("mood", "model", "gm frens", 49.6)) == 72.0
+    assert cache.get(cache.key("mood", "other-model", "gm frens", 50.0)) is None
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 2)
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", 1.0)
+    cache.set("b", 2.0)
+    cache.get("a")  # "b" is now the least recently used
+
+    cache.set("c", 3.0)
+
+    assert [cache.get(key) for key in ("a", "b", "c")] == [1.0, None, 3.0]
+    assert cache.stats["evictions"] == 1
+
+
+def test_namespace_change_invalidates(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path, namespace="v1")
+    cache.set("a", 1.0)
+    cache.close()
+
+    assert ResponseCache(path, namespace="v1").get("a") == 1.0
+    assert ResponseCache(path, namespace="v2").get("a") is None
+    # The new namespace is stored, going back doesn't resurrect anything
+    assert ResponseCache(path, namespace="v1").get("a") is None
+
+
+def test_concurrent_callers_share_one_compute(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42.0, True
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42.0] * 5
+    assert len(calls) == 1
+    assert cache.stats["joined"] == 4
+    assert cache.get("k") == 42.0
+
+
+def test_uncacheable_and_failed_results_are_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    async def fallback():
+        return 50.0, False
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def main():
+        first = await asyncio.gather(cache.get_or_compute("k", fallback), cache.get_or_compute("k", fallback))
+        failed = await asyncio.gather(cache.get_or_compute("e", failing), return_exceptions=True)
+        return first, failed
+
+    first, failed = asyncio.run(main())
+    assert first == [50.0, 50.0]
+    assert isinstance(failed[0], RuntimeError)
+    assert cache.get("k") is None and cache.get("e") is None
+    assert not cache._inflight
+
+
+def test_editing_batch_prompts_invalidates_the_agent_cache(make_agent, monkeypatch, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    items = [(f"post number {i} about eth", None) for i in range(2)]
+    make_agent(cycles=1, cache_path=path).analyze_many(items, batch_size=8)
+
+    edited = {name: ChatPromptTemplate.from_template(prompt.messages[0].prompt.template + "\nBe strict.")
+              for name, prompt in prompts.PROMPT_LAYOUTS["classic"]["batch"].items()}
+    monkeypatch.setitem(prompts.PROMPT_LAYOUTS["classic"], "batch", edited)
+    agent = make_agent(cycles=1, cache_path=path)
+    agent.analyze_many(items, batch_size=8)
+
+    assert agent.cache.stats["hits"] == 0
+    assert agent.llm.fake.requests == len(agent.chains)
+
+
+def test_batch_answers_are_cached_apart_from_single_ones(make_agent, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    items = [(f"post number {i} about eth", None) for i in range(2)]
+    make_agent(cycles=1, cache_path=path).analyze_many(items, batch_size=8)
+
+    rerun = make_agent(cycles=1, cache_path=path)
+    rerun.analyze_many(items, batch_size=8)
+    assert rerun.llm.fake.requests == 0
+
+    # The single-post path doesn't pick up answers to the batch prompt
+    single = make_agent(cycles=1, cache_path=path)
+    asyncio.run(single.analyze_concurrent(*items[0]))
+    assert single.llm.fake.requests == len(single.chains)
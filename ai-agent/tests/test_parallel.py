@@ -0,0 +1,50 @@
+import asyncio
+from parallel import analyze_sharded
+
+ITEMS = [(f"post number {i} about eth", "nice" if i % 3 == 0 else None) for i in range(8)]
+OPTIONS = {"batch_size": 4}  # Each of the two shards is exactly one single-process batch
+
+
+def per_request(metrics):
+    """Observation counts of the per-request metrics and every counter
+
+    Per-batch stages (encoder, forward, cycles) legitimately run once per shard instead of once.
+    """
+    state = metrics.state()
+    histograms = {key: histogram["count"] for key, histogram in state["histograms"].items()
+                  if key[0].startswith("llm_") or "chain" in dict(key[1])}
+    return histograms, state["counters"]
+
+
+def single_and_sharded(make_agent, tmp_path, **kwargs):
+    single = make_agent(cycles=1, cache_path=str(tmp_path / "single.sqlite"), **kwargs)
+    single.warmup()
+    single.pretokenize(ITEMS)
+    single_results = asyncio.run(single.analyze_many_concurrent(ITEMS, **OPTIONS))
+
+    sharded = make_agent(cycles=1, cache_path=str(tmp_path / "sharded.sqlite"), **kwargs)
+    sharded_results = analyze_sharded(sharded, ITEMS, workers=2, **OPTIONS)
+    return single, single_results, sharded, sharded_results
+
+
+def test_sharded_totals_match_a_single_process(make_agent, tmp_path):
+    single, single_results, sharded, sharded_results = single_and_sharded(make_agent, tmp_path)
+
+    assert [result.score for result in sharded_results] == [result.score for result in single_results]
+    # The LLM ran in the workers, everything they counted is merged back into the parent
+    assert sharded.llm.fake.requests == 0
+    assert sharded.llm_stats == single.llm_stats and sharded.llm_stats["requests"] > 0
+    assert sharded.gate_stats == single.gate_stats
+    # Slowdowns and decreases depend on wall-clock latencies, not on the merge
+    assert sharded.limiter.stats["successes"] == single.limiter.stats["successes"] == single.llm_stats["requests"]
+    assert sharded.cache.stats == single.cache.stats
+    assert sharded.usage.summary(posts=len(ITEMS)) == single.usage.summary(posts=len(ITEMS))
+    assert per_request(sharded.metrics) == per_request(single.metrics)
+    assert per_request(sharded.metrics)[0]
+
+
+def test_sharded_reuse_entries_reach_the_parent(make_agent, tmp_path):
+    single, _, sharded, _ = single_and_sharded(make_agent, tmp_path, reuse_threshold=0.999)
+
+    assert sharded.reuse_index.size == single.reuse_index.size > 0
+    assert sharded.reuse_index.stats == single.reuse_index.stats
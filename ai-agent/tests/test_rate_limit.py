@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+from fake_llm import FakeChatModel, FakeRateLimitError
+from rate_limit import AdaptiveLimiter, TokenBucket
+from sentiment_agent import parse_score
+
+
+def test_additive_increase_is_capped():
+    limiter = AdaptiveLimiter(max_concurrency=4)
+    limiter.limit = 2.0
+    for _ in range(100):
+        limiter.observe_latency(None)
+    assert limiter.limit == 4
+
+
+def test_rate_limit_halves_once_per_cooldown():
+    limiter = AdaptiveLimiter(max_concurrency=16)
+    limiter.active = 2
+    limiter.release(error=FakeRateLimitError("429"))
+    limiter.release(error=FakeRateLimitError("429"))
+    assert limiter.limit == 8
+    assert limiter.stats["rate_limited"] == 2
+    assert limiter.stats["decreases"] == 1
+
+
+def test_decrease_respects_min_concurrency():
+    limiter = AdaptiveLimiter(max_concurrency=2, min_concurrency=1)
+    for _ in range(3):
+        limiter.last_decrease = 0.0
+        limiter.decrease()
+    assert limiter.limit == 1
+
+
+def test_latency_spike_backs_off():
+    limiter = AdaptiveLimiter(max_concurrency=16)
+    limiter.observe_latency(0.1)
+    for _ in range(20):
+        limiter.observe_latency(5.0)
+    assert limiter.stats["slowdowns"] >= 1
+    assert limiter.limit < 16
+
+
+def test_cancelled_requests_do_not_back_off():
+    limiter = AdaptiveLimiter(max_concurrency=16)
+    limiter.active = 1
+    limiter.release(error=asyncio.CancelledError())
+    assert limiter.limit == 16
+    assert limiter.active == 0
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def scenario():
+        limiter = AdaptiveLimiter(max_concurrency=1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        limiter.release(latency=0.01)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_split_shares_the_budget():
+    limiter = AdaptiveLimiter(max_concurrency=16, requests_per_minute=600)
+    limiter.split(4)
+    assert limiter.max_concurrency == 4
+    assert limiter.request_bucket.rate == pytest.approx(600 / 60 / 4)
+
+
+def test_hedge_slots_never_wait():
+    async def scenario():
+        limiter = AdaptiveLimiter(max_concurrency=8, hedge_slots=1)
+        assert limiter.try_acquire_hedge()
+        assert not limiter.try_acquire_hedge()
+        limiter.release(latency=0.01, hedge=True)
+        assert limiter.try_acquire_hedge()
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_try_take():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.try_take(2)
+    assert not bucket.try_take(1)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("72", 72.0),
+    ("Adjusted Score: 64.5", 64.5),
+    ("", None),
+    ("no number", None),
+    ("150", None),
+])
+def test_parse_score(text, expected):
+    assert parse_score(text) == expected
+
+
+def test_empty_reply_keeps_the_score_and_is_not_cached(make_agent, tmp_path):
+    llm = FakeChatModel(latency_ms=0)
+    llm.fake.reply = lambda prompt: ""
+    agent = make_agent(llm=llm, cycles=1, cache_path=str(tmp_path / "cache.sqlite"))
+
+    result = agent.analyze("an empty reply")
+    assert result.score == pytest.approx(agent.cache.quantize(result.base_score))
+    assert agent.llm_stats["fallbacks"] == len(agent.chains)
+
+    # Nothing was cached, so a rerun asks the LLM again and now gets real scores
+    llm.fake.reply = lambda prompt: "80"
+    assert agent.analyze("an empty reply").score == 80
+    assert llm.fake.requests == 2 * len(agent.chains)
+
+
+def test_rate_limited_requests_are_retried(make_agent, monkeypatch):
+    llm = FakeChatModel(latency_ms=0)
+    next_outcome = llm.fake.next_outcome
+    outcomes = iter([(0.0, FakeRateLimitError("429"))])
+    # Only the very first request gets a 429
+    llm.fake.next_outcome = lambda: next(outcomes, None) or next_outcome()
+    agent = make_agent(llm=llm, cycles=1)
+    monkeypatch.setattr(agent, "RETRY_BACKOFF", 0.0)
+
+    agent.analyze("retry me")
+
+    assert agent.llm_stats["retries"] == 1
+    assert agent.limiter.stats["rate_limited"] == 1
+    assert agent.llm_stats["fallbacks"] == 0
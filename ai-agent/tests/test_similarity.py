@@ -0,0 +1,94 @@
+import numpy as np
+from similarity import EmbeddingIndex
+
+
+def unit(i, dim=4):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_lookup_reuses_close_vectors_only():
+    index = EmbeddingIndex(threshold=0.97)
+    index.add(unit(0), 80.0)
+
+    assert index.lookup(unit(0) * 3 + unit(1) * 0.1) == 80.0
+    assert index.lookup(unit(1)) is None
+    assert index.report()["reused"] == 1
+    assert index.reuse_rate == 0.5
+
+
+def test_empty_index_misses():
+    assert EmbeddingIndex().lookup_many([unit(0), unit(1)]) == [None, None]
+
+
+def test_full_index_evicts_least_recently_used():
+    index = EmbeddingIndex(max_entries=2)
+    index.add(unit(0), 10.0)
+    index.add(unit(1), 20.0)
+    index.lookup(unit(0))  # unit(1) is now the least recently used
+
+    index.add(unit(2), 30.0)
+
+    assert index.lookup_many([unit(0), unit(1), unit(2)]) == [10.0, None, 30.0]
+    assert index.report()["evictions"] == 1
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "index.npz")
+    index = EmbeddingIndex(path=path, namespace="stub")
+    index.add_many([unit(0), unit(1)], [10.0, 20.0])
+    index.save()
+
+    loaded = EmbeddingIndex(path=path, namespace="stub")
+
+    assert loaded.size == 2
+    assert loaded.lookup_many([unit(0), unit(1)]) == [10.0, 20.0]
+
+
+def test_load_keeps_most_recent_when_the_cap_shrank(tmp_path):
+    path = str(tmp_path / "index.npz")
+    index = EmbeddingIndex(path=path)
+    index.add_many([unit(0), unit(1), unit(2)], [10.0, 20.0, 30.0])
+    index.lookup(unit(0))
+    index.save()
+
+    loaded = EmbeddingIndex(path=path, max_entries=2)
+
+    assert loaded.lookup_many([unit(0), unit(1), unit(2)]) == [10.0, None, 30.0]
+
+
+def test_other_namespace_is_ignored(tmp_path):
+    path = str(tmp_path / "index.npz")
+    index = EmbeddingIndex(path=path, namespace="roberta")
+    index.add(unit(0), 10.0)
+    index.save()
+
+    assert EmbeddingIndex(path=path, namespace="stub").size == 0
+
+
+def test_record_additions_journals_new_entries():
+    index = EmbeddingIndex()
+    index.add(unit(0), 10.0)
+    index.record_additions()
+    index.add(unit(1) * 2, 20.0)
+
+    assert [score for _, score in index.added] == [20.0]
+    assert np.allclose(index.added[0][0], unit(1))
+
+    merged = EmbeddingIndex()
+    merged.add_many(*zip(*index.added))
+    assert merged.lookup(unit(1)) == 20.0
+
+
+def test_agent_index_only_serves_matching_settings(make_agent, tmp_path):
+    path = str(tmp_path / "reuse.npz")
+    first = make_agent(cycles=1, reuse_threshold=0.99, reuse_index_path=path)
+    first.analyze_many([("post about eth", None), ("another post", None)])
+    first.save_reuse_index()
+    assert first.reuse_index.size == 2
+
+    # The threshold only decides what counts as a match, not what the stored scores mean
+    assert make_agent(cycles=1, reuse_threshold=0.9, reuse_index_path=path).reuse_index.size == 2
+    assert make_agent(cycles=2, reuse_threshold=0.99, reuse_index_path=path).reuse_index.size == 0
+    assert make_agent(cycles=1, refinement="fused", reuse_threshold=0.99, reuse_index_path=path).reuse_index.size == 0
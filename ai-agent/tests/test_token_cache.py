@@ -0,0 +1,95 @@
+import numpy as np
+from token_cache import TokenCache
+from conftest import StubTokenizer
+
+
+TEXTS = ["gm frens", "this dip is a gift", "rug pull incoming for sure"]
+
+
+def expected(text):
+    return StubTokenizer()([text])["input_ids"][0]
+
+
+def test_get_tokenizes_misses_then_hits(tmp_path):
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+
+    first = cache.get(TEXTS)
+    again = cache.get(TEXTS)
+
+    assert [list(ids) for ids in first] == [expected(text) for text in TEXTS]
+    assert [list(ids) for ids in again] == [expected(text) for text in TEXTS]
+    assert (cache.misses, cache.hits) == (3, 3)
+
+
+def test_round_trip_through_disk(tmp_path):
+    TokenCache(StubTokenizer(), directory=str(tmp_path)).pretokenize(TEXTS)
+
+    reopened = TokenCache(StubTokenizer(), directory=str(tmp_path))
+
+    assert all(text in reopened for text in TEXTS)
+    assert [list(ids) for ids in reopened.get(TEXTS)] == [expected(text) for text in TEXTS]
+    assert reopened.misses == 0
+
+
+def test_appends_after_reopen_keep_offsets(tmp_path):
+    TokenCache(StubTokenizer(), directory=str(tmp_path)).add(TEXTS[:1])
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+
+    assert cache.add(TEXTS) == 2
+    assert [list(ids) for ids in cache.get(TEXTS)] == [expected(text) for text in TEXTS]
+
+
+def test_read_only_keeps_misses_in_memory(tmp_path):
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+    cache.add(TEXTS[:1])
+    cache.read_only = True
+
+    ids = cache.get(TEXTS)
+
+    assert [list(row) for row in ids] == [expected(text) for text in TEXTS]
+    assert len(cache.extra) == 2
+    # Nothing new reached the files
+    reopened = TokenCache(StubTokenizer(), directory=str(tmp_path))
+    assert TEXTS[0] in reopened and TEXTS[1] not in reopened
+
+
+def test_lengths_include_special_tokens(tmp_path):
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+
+    assert cache.lengths(TEXTS) == [len(text.split()) + 2 for text in TEXTS]
+    assert cache.get(TEXTS)[0].dtype == np.int32
+
+
+def test_tokenizer_change_uses_a_new_directory(tmp_path):
+    class OtherTokenizer(StubTokenizer):
+        name_or_path = "other-tokenizer"
+
+    TokenCache(StubTokenizer(), directory=str(tmp_path)).add(TEXTS)
+
+    assert TEXTS[0] not in TokenCache(OtherTokenizer(), directory=str(tmp_path))
+
+
+def test_ids_orphaned_by_a_crash_are_dropped_on_open(tmp_path):
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+    cache.add(TEXTS[:1])
+    # A crash between appending ids and appending their index records
+    with open(cache.ids_path, "ab") as f:
+        np.array([0, 7, 7, 7, 2], dtype=np.int32).tofile(f)
+
+    reopened = TokenCache(StubTokenizer(), directory=str(tmp_path))
+    reopened.add(TEXTS[1:])
+
+    for cache in (reopened, TokenCache(StubTokenizer(), directory=str(tmp_path))):
+        assert [list(ids) for ids in cache.get(TEXTS)] == [expected(text) for text in TEXTS]
+
+
+def test_torn_index_record_is_dropped_on_open(tmp_path):
+    cache = TokenCache(StubTokenizer(), directory=str(tmp_path))
+    cache.add(TEXTS)
+    with open(cache.index_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+
+    reopened = TokenCache(StubTokenizer(), directory=str(tmp_path))
+
+    assert TEXTS[-1] not in reopened
+    assert [list(ids) for ids in reopened.get(TEXTS)] == [expected(text) for text in TEXTS]
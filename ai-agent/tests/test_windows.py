@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from windows import REDUCERS, split_windows
+
+
+def wrapped(body_length):
+    return np.array([0] + list(range(10, 10 + body_length)) + [2])
+
+
+def test_short_text_is_a_single_window():
+    ids = wrapped(5)
+    windows = split_windows(ids, max_length=16, stride=4)
+
+    assert len(windows) == 1
+    assert list(windows[0]) == list(ids)
+
+
+def test_windows_keep_the_wrapper_and_the_max_length():
+    windows = split_windows(wrapped(40), max_length=16, stride=4)
+
+    for window in windows:
+        assert len(window) == 16
+        assert window[0] == 0 and window[-1] == 2
+
+
+def test_windows_overlap_by_stride_and_cover_the_body():
+    body = list(wrapped(40)[1:-1])
+    windows = [list(window[1:-1]) for window in split_windows(wrapped(40), max_length=16, stride=4)]
+
+    # Consecutive windows share stride tokens, except the last, which is aligned to the end
+    for left, right in zip(windows[:-2], windows[1:-1]):
+        assert left[-4:] == right[:4]
+    assert windows[-1] == body[-14:]
+    assert sorted(set(token for window in windows for token in window)) == body
+
+
+def test_stride_too_large_still_advances():
+    windows = split_windows(wrapped(20), max_length=8, stride=10)
+
+    starts = [window[1] for window in windows]
+    assert starts == sorted(set(starts))
+
+
+def test_reducers():
+    probabilities = np.array([[0.6, 0.3, 0.1], [0.1, 0.1, 0.8]])
+
+    assert REDUCERS["mean"](probabilities, [3, 1]) == pytest.approx([0.475, 0.25, 0.275])
+    assert list(REDUCERS["max_abs"](probabilities, [3, 1])) == [0.1, 0.1, 0.8]
+    assert list(REDUCERS["first"](probabilities, [3, 1])) == [0.6, 0.3, 0.1]
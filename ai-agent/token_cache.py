@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import numpy as np
+import transformers
+
+DEFAULT_TOKEN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jester", "tokens")
+
+# One fixed-size record per cached text: text hash, offset into ids.bin, token count
+INDEX_DTYPE = np.dtype([("hash", "S16"), ("offset", "<i8"), ("length", "<i4")])
+ID_DTYPE = np.dtype("<i4")
+
+
+def tokenizer_version(tokenizer):
+    """Anything that could change the ids a tokenizer produces"""
+    parts = [
+        tokenizer.name_or_path,
+        type(tokenizer).__name__,
+        str(len(tokenizer)),
+        transformers.__version__
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TokenCache:
+    """Pre-tokenized texts in a memory-mapped int32 array with an append-only offset index
+
+    Ids are stored untruncated with special tokens, so both truncating and sliding-window
+    scoring can read them. Only the index (hash -> offset, length) is held in memory.
+    """
+
+    ENCODE_BATCH = 1024
+
+    def __init__(self, tokenizer, directory=DEFAULT_TOKEN_CACHE_DIR, tokenizer_lock=None):
+        self.tokenizer = tokenizer
+        self.tokenizer_lock = tokenizer_lock or threading.Lock()  # Shared with the encoder using the same tokenizer
+        self.read_only = False  # Forked workers must not append to files the others are reading
+        self.extra = {}         # Misses tokenized while read-only, kept in memory only
+        self._lock = threading.Lock()
+        self.directory = os.path.join(directory, tokenizer_version(tokenizer))
+        os.makedirs(self.directory, exist_ok=True)
+        self.ids_path = os.path.join(self.directory, "ids.bin")
+        self.index_path = os.path.join(self.directory, "index.bin")
+
+        self.index = {}
+        self.size = 0
+        if os.path.exists(self.index_path):
+            self._truncate(self.index_path, os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize)
+            records = np.fromfile(self.index_path, dtype=INDEX_DTYPE)
+            for record in records:
+                self.index[bytes(record["hash"])] = (int(record["offset"]), int(record["length"]))
+            if len(records):
+                self.size = int(records["offset"][-1] + records["length"][-1])
+        # Ids appended by a run that crashed before writing their index records would shift the
+        # offsets of everything appended after them, drop them before appending anything else
+        self._truncate(self.ids_path, self.size * ID_DTYPE.itemsize)
+
+        self.ids = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _truncate(path, size):
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _mapped(self):
+        """Memory map of ids.bin, remapped when appends have grown it past the current view"""
+        if self.ids is None or len(self.ids) < self.size:
+            self.ids = np.memmap(self.ids_path, dtype=ID_DTYPE, mode="r", shape=(self.size,)) if self.size else None
+        return self.ids
+
+    def add(self, texts):
+        """Tokenize and append every text that isn't cached yet, returns how many were added"""
+        with self._lock:
+            return self._add(texts)
+
+    def encode(self, texts):
+        with self.tokenizer_lock:
+            return self.tokenizer(texts, truncation=False)["input_ids"]
+
+    def _add(self, texts):
+        new = {}
+        for text in texts:
+            key = text_hash(text)
+            if key not in self.index and key not in self.extra and key not in new:
+                new[key] = text
+        keys = list(new)
+
+        if self.read_only:
+            encoded = self.encode([new[key] for key in keys]) if keys else []
+            for key, ids in zip(keys, encoded):
+                self.extra[key] = np.asarray(ids, dtype=ID_DTYPE)
+            return len(keys)
+
+        for start in range(0, len(keys), self.ENCODE_BATCH):
+            batch = keys[start:start + self.ENCODE_BATCH]
+            encoded = self.encode([new[key] for key in batch])
+
+            records = np.zeros(len(batch), dtype=INDEX_DTYPE)
+            with open(self.ids_path, "ab") as f:
+                for i, (key, ids) in enumerate(zip(batch, encoded)):
+                    np.asarray(ids, dtype=ID_DTYPE).tofile(f)
+                    records[i] = (key, self.size, len(ids))
+                    self.index[key] = (self.size, len(ids))
+                    self.size += len(ids)
+
+            # Index records go last, so a crash mid-batch only leaves unreferenced ids behind,
+            # which the next open truncates away
+            with open(self.index_path, "ab") as f:
+                records.tofile(f)
+        return len(keys)
+
+    def pretokenize(self, texts):
+        """Batch-encode a whole corpus ahead of scoring"""
+        return self.add(texts)
+
+    def __contains__(self, text):
+        key = text_hash(text)
+        return key in self.index or key in self.extra
+
+    def get(self, texts):
+        """Token ids (views into the memory map) for each text, tokenizing any misses first"""
+        missing = [text for text in texts if text not in self]
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        with self._lock:
+            if missing:
+                self._add(missing)
+            ids = self._mapped()
+
+        result = []
+        for text in texts:
+            key = text_hash(text)
+            if key in self.extra:
+                result.append(self.extra[key])
+            else:
+                offset, length = self.index[key]
+                result.append(ids[offset:offset + length])
+        return result
+
+    def lengths(self, texts):
+        """Token counts straight from the index, no tokenizing when everything is cached"""
+        missing = [text for text in texts if text not in self]
+        if missing:
+            self.add(missing)
+        return [len(self.extra[key]) if key in self.extra else self.index[key][1]
+                for key in map(text_hash, texts)]
@@ -0,0 +1,130 @@
+import contextvars
+import threading
+from collections import Counter
+
+# USD per million tokens (input, cached input, output). List prices when this was written, pass
+# pricing= to UsageTracker for negotiated rates or models missing here. Reasoning tokens are
+# billed as output tokens and are already included in the output count.
+PRICING = {
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+FIELDS = ("requests", "input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens")
+
+# Usage of whichever post(s) and cycle the current task is working on, set by SentimentAgent
+current_scope = contextvars.ContextVar("usage_scope", default=None)
+
+
+class Scope:
+    """Where a request's usage is attributed: one or more posts (split evenly) and a cycle"""
+
+    def __init__(self, posts, cycle=0):
+        self.posts = posts
+        self.cycle = cycle
+
+
+def usage_from(response):
+    """Token counts from a LangChain message's usage_metadata, zeros when the provider sent none"""
+    metadata = getattr(response, "usage_metadata", None) or {}
+    input_details = metadata.get("input_token_details") or {}
+    output_details = metadata.get("output_token_details") or {}
+    return Counter({
+        "requests": 1,
+        "input_tokens": metadata.get("input_tokens", 0),
+        "cached_tokens": input_details.get("cache_read", 0) or 0,
+        "output_tokens": metadata.get("output_tokens", 0),
+        "reasoning_tokens": output_details.get("reasoning", 0) or 0
+    })
+
+
+def price_for(model_name, pricing):
+    """Longest matching prefix, so dated snapshots like o4-mini-2025-04-16 find their base model"""
+    matches = [name for name in pricing if model_name.startswith(name)]
+    return pricing[max(matches, key=len)] if matches else None
+
+
+class UsageTracker:
+    """Token counts and estimated cost per chain, cycle, model and for the whole run"""
+
+    def __init__(self, pricing=None):
+        self.pricing = dict(PRICING, **(pricing or {}))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything counted so far, e.g. in a forked worker that inherited the parent's counts"""
+        with self._lock:
+            self.total = Counter()
+            self.by_chain = {}
+            self.by_cycle = {}
+            self.by_model = {}
+            self.unpriced = set()
+
+    def cost(self, usage, model_name):
+        price = price_for(model_name, self.pricing)
+        if price is None:
+            self.unpriced.add(model_name)
+            return 0.0
+        input_price, cached_price, output_price = price
+        uncached = usage["input_tokens"] - usage["cached_tokens"]
+        return (uncached * input_price + usage["cached_tokens"] * cached_price
+                + usage["output_tokens"] * output_price) / 1_000_000
+
+    def record(self, usage, chain, model_name):
+        """Add one response's usage everywhere it belongs, including the current post(s)"""
+        usage = Counter(usage)
+        usage["cost_usd"] = self.cost(usage, model_name)
+        scope = current_scope.get()
+
+        with self._lock:
+            self.total.update(usage)
+            self.by_chain.setdefault(chain, Counter()).update(usage)
+            self.by_model.setdefault(model_name, Counter()).update(usage)
+            if scope is not None:
+                self.by_cycle.setdefault(scope.cycle, Counter()).update(usage)
+                for post in scope.posts:
+                    post.update({key: value / len(scope.posts) for key, value in usage.items()})
+        return usage
+
+    def state(self):
+        """Plain counters, e.g. to send a forked worker's usage back to the parent"""
+        with self._lock:
+            return {
+                "total": Counter(self.total),
+                "by_chain": {name: Counter(usage) for name, usage in self.by_chain.items()},
+                "by_cycle": {cycle: Counter(usage) for cycle, usage in self.by_cycle.items()},
+                "by_model": {name: Counter(usage) for name, usage in self.by_model.items()},
+                "unpriced": set(self.unpriced)
+            }
+
+    def merge(self, state):
+        with self._lock:
+            self.total.update(state["total"])
+            for group in ("by_chain", "by_cycle", "by_model"):
+                for key, usage in state[group].items():
+                    getattr(self, group).setdefault(key, Counter()).update(usage)
+            self.unpriced |= state["unpriced"]
+
+    @staticmethod
+    def rounded(usage):
+        rounded = {key: round(usage[key], 6 if key == "cost_usd" else 2) for key in FIELDS + ("cost_usd",)}
+        # Share of prompt tokens the provider served from its prompt cache
+        rounded["cached_ratio"] = round(usage["cached_tokens"] / usage["input_tokens"], 4) if usage["input_tokens"] else 0.0
+        return rounded
+
+    def summary(self, posts=None):
+        summary = {
+            "total": self.rounded(self.total),
+            "by_chain": {name: self.rounded(usage) for name, usage in sorted(self.by_chain.items())},
+            "by_cycle": {str(cycle): self.rounded(usage) for cycle, usage in sorted(self.by_cycle.items())},
+            "by_model": {name: self.rounded(usage) for name, usage in sorted(self.by_model.items())}
+        }
+        if posts:
+            summary["per_post"] = {key: round(self.total[key] / posts, 6) for key in FIELDS + ("cost_usd",)}
+        if self.unpriced:
+            summary["unpriced_models"] = sorted(self.unpriced)
+        return summary
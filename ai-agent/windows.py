@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def split_windows(ids, max_length, stride):
+    """Overlapping windows over a text's full token ids, each keeping the <s> ... </s> wrapper
+
+    ids must include the special tokens (tokenizer output with truncation=False). Consecutive
+    windows share `stride` body tokens, and the last window is aligned to the end of the text.
+    """
+    if len(ids) <= max_length:
+        return [ids]
+
+    bos, body, eos = ids[:1], ids[1:-1], ids[-1:]
+    width = max_length - 2
+    step = max(1, width - stride)
+    starts = list(range(0, len(body) - width, step)) + [len(body) - width]
+    return [np.concatenate([bos, body[start:start + width], eos]) for start in starts]
+
+
+def weighted_mean(probabilities, lengths):
+    """Average of the window probabilities, weighted by each window's token count"""
+    weights = np.asarray(lengths, dtype=np.float64)
+    return (probabilities * weights[:, None]).sum(axis=0) / weights.sum()
+
+
+def max_abs(probabilities, lengths):
+    """The window with the strongest polarity, |P(positive) - P(negative)|"""
+    return probabilities[np.argmax(np.abs(probabilities[:, 2] - probabilities[:, 0]))]
+
+
+def first(probabilities, lengths):
+    """Only the opening window, the same as plain truncation"""
+    return probabilities[0]
+
+
+REDUCERS = {
+    "mean": weighted_mean,
+    "max_abs": max_abs,
+    "first": first
+}